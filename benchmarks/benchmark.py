@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+"""Benchmarks jaweson's JSON and MsgPack de|serialisation.
+
+Each payload is serialised with jaweson, and an equivalent payload of
+native types is serialised with the raw json / msgpack modules as a
+baseline. Results are written as JSON::
+
+    python benchmarks/benchmark.py --output results.json
+    python benchmarks/benchmark.py --compare results.json
+
+The peak memory of each case is the peak resident size of a new process
+which runs the case once.
+
+Run with Python 2 from the repository root, or with jaweson installed.
+"""
+from __future__ import absolute_import, division, print_function
+import argparse
+import gc
+import json as stdlib_json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import jaweson
+from jaweson import json
+
+try:
+    import msgpack as stdlib_msgpack
+    from jaweson import msgpack
+except ImportError:
+    stdlib_msgpack = None
+    msgpack = None
+
+try:
+    import resource
+except ImportError:
+    # no peak memory on windows
+    resource = None
+
+
+class Record(jaweson.Serialisable):
+    def __init__(self, i):
+        self.id = i
+        self.name = 'record {}'.format(i)
+        self.value = i * 0.5
+        self.active = bool(i % 2)
+        self.tags = ['a', 'b']
+
+
+class Node(jaweson.Serialisable):
+    def __init__(self, depth, width):
+        self.depth = depth
+        self.label = 'node {}'.format(depth)
+        self.children = [
+            Node(depth - 1, width)
+            for _ in range(width)
+        ] if depth else []
+
+
+def _node_baseline(node):
+    return {
+        'depth': node.depth,
+        'label': node.label,
+        'children': [_node_baseline(child) for child in node.children],
+    }
+
+
+def small_tagged():
+    obj = [
+        {
+            'set': set([i, i + 1]),
+            'tuple': (i, 'a'),
+            'complex': complex(i, 1),
+        }
+        for i in range(2000)
+    ]
+    baseline = [
+        {
+            'set': [i, i + 1],
+            'tuple': [i, 'a'],
+            'complex': [float(i), 1.0],
+        }
+        for i in range(2000)
+    ]
+    return obj, baseline
+
+
+def datetime_log():
+    start = datetime(2015, 1, 1)
+    obj = [
+        {
+            'time': start + timedelta(seconds=i * 37, microseconds=i),
+            'level': 'info',
+            'message': 'event {}'.format(i),
+        }
+        for i in range(5000)
+    ]
+    baseline = [
+        dict(entry, time=entry['time'].isoformat())
+        for entry in obj
+    ]
+    return obj, baseline
+
+
+def large_arrays():
+    obj = [
+        np.random.RandomState(i).rand(250000)
+        for i in range(4)
+    ]
+    baseline = [a.tolist() for a in obj]
+    return obj, baseline
+
+
+def small_arrays():
+    obj = [
+        np.arange(i % 16, dtype=np.float32)
+        for i in range(2000)
+    ]
+    baseline = [a.tolist() for a in obj]
+    return obj, baseline
+
+
+def deep_graph():
+    obj = Node(7, 3)
+    return obj, _node_baseline(obj)
+
+
+def wide_records():
+    obj = [Record(i) for i in range(10000)]
+    baseline = [
+        dict((k, v) for k, v in vars(r).items())
+        for r in obj
+    ]
+    return obj, baseline
+
+
+payloads = [
+    ('small_tagged', small_tagged),
+    ('datetime_log', datetime_log),
+    ('large_arrays', large_arrays),
+    ('small_arrays', small_arrays),
+    ('deep_graph', deep_graph),
+    ('wide_records', wide_records),
+]
+
+
+def _formats():
+    formats = [
+        ('json', json.dumps, json.loads, stdlib_json.dumps, stdlib_json.loads),
+    ]
+    if msgpack:
+        formats.append(
+            ('msgpack', msgpack.dumps, msgpack.loads, stdlib_msgpack.dumps, stdlib_msgpack.loads),
+        )
+    return formats
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    i = min(len(values) - 1, int(round(p / 100. * (len(values) - 1))))
+    return values[i]
+
+
+def _max_rss():
+    '''Returns the peak resident size of this process in bytes.
+    '''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes, except on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _case(name, format, implementation, operation, path=None):
+    '''Returns the function and argument of a benchmark case.
+    Decode cases read their data from path.
+    '''
+    formats = dict((f[0], f[1:]) for f in _formats())
+    dumps, loads, raw_dumps, raw_loads = formats[format]
+    jaweson = implementation == 'jaweson'
+    if operation == 'decode':
+        with open(path, 'rb') as f:
+            data = f.read()
+        return (loads if jaweson else raw_loads), data
+    obj, baseline = dict(payloads)[name]()
+    if jaweson:
+        return dumps, obj
+    return raw_dumps, baseline
+
+
+def memory_case(name, format, implementation, operation, path=None):
+    '''Runs a benchmark case once, returning the peak resident size of
+    the process in bytes.
+    '''
+    f, arg = _case(name, format, implementation, operation, path)
+    gc.collect()
+    f(arg)
+    return _max_rss()
+
+
+def peak_memory(name, format, implementation, operation, data):
+    '''Returns the peak memory of a benchmark case, measured in a new
+    process, or None if the platform has no resource module.
+    The process only builds the payload for encode cases, and only reads
+    data for decode cases, so all cases include the interpreter.
+    '''
+    if resource is None:
+        return None
+    args = [
+        sys.executable, os.path.abspath(__file__),
+        '--memory', name, format, implementation, operation,
+    ]
+    if operation == 'encode':
+        return int(subprocess.check_output(args))
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data if isinstance(data, bytes) else data.encode('utf-8'))
+        return int(subprocess.check_output(args + [path]))
+    finally:
+        os.remove(path)
+
+
+def measure(f, arg, repeat, size):
+    '''Calls f(arg) repeat times, returning the timing statistics.
+    '''
+    # warm up caches
+    f(arg)
+
+    timer = timeit.default_timer
+    times = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = timer()
+            f(arg)
+            times.append(timer() - start)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    total = sum(times)
+    return {
+        'iterations': repeat,
+        'mean': total / repeat,
+        'min': min(times),
+        'p50': _percentile(times, 50),
+        'p90': _percentile(times, 90),
+        'p99': _percentile(times, 99),
+        'throughput_mb_s': size * repeat / total / 1e6 if total else None,
+    }
+
+
+def run(repeat, names=None, formats=None, memory=True):
+    results = []
+    for name, payload in payloads:
+        if names and name not in names:
+            continue
+        obj, baseline = payload()
+        for format, dumps, loads, raw_dumps, raw_loads in _formats():
+            if formats and format not in formats:
+                continue
+            for implementation, value, encode, decode in (
+                ('jaweson', obj, dumps, loads),
+                ('baseline', baseline, raw_dumps, raw_loads),
+            ):
+                data = encode(value)
+                for operation, f, arg in (
+                    ('encode', encode, value),
+                    ('decode', decode, data),
+                ):
+                    result = {
+                        'payload': name,
+                        'format': format,
+                        'implementation': implementation,
+                        'operation': operation,
+                        'size': len(data),
+                    }
+                    result.update(measure(f, arg, repeat, len(data)))
+                    result['peak_memory'] = (
+                        peak_memory(name, format, implementation, operation, data)
+                        if memory else None
+                    )
+                    results.append(result)
+                    print(
+                        '{payload:14} {format:8} {implementation:9} {operation:7} '
+                        '{mean:9.5f}s p99 {p99:9.5f}s'.format(**result),
+                        file=sys.stderr,
+                    )
+    return results
+
+
+def _key(result):
+    return (result['payload'], result['format'], result['implementation'], result['operation'])
+
+
+def compare(results, previous):
+    '''Prints the change in mean time of each result from previous results.
+    '''
+    previous = dict((_key(r), r) for r in previous['results'])
+    for result in results:
+        old = previous.get(_key(result))
+        if not old:
+            continue
+        change = (result['mean'] - old['mean']) / old['mean'] * 100
+        print('{} {:+7.1f}%'.format(' '.join(_key(result)), change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=20, help='iterations of each benchmark')
+    parser.add_argument('--payload', action='append', help='payloads to run, defaults to all')
+    parser.add_argument('--format', action='append', help='formats to run, defaults to all')
+    parser.add_argument('--output', help='file to write the results to, defaults to stdout')
+    parser.add_argument('--compare', help='results file to compare against')
+    parser.add_argument('--no-memory', action='store_true', help='skip measuring peak memory')
+    parser.add_argument('--memory', nargs='+', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if sys.version_info[0] > 2:
+        # serialisers are registered by python 2 metaclasses
+        parser.error('jaweson requires Python 2')
+
+    if args.memory:
+        # a peak memory measurement, see peak_memory
+        print(memory_case(*args.memory))
+        return
+
+    results = run(args.repeat, args.payload, args.format, not args.no_memory)
+    document = {
+        'jaweson': jaweson.__version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'msgpack': '.'.join(map(str, stdlib_msgpack.version)) if stdlib_msgpack else None,
+        'repeat': args.repeat,
+        'results': results,
+    }
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(results, stdlib_json.load(f))
+
+    data = stdlib_json.dumps(document, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(data)
+    elif not args.compare:
+        print(data)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Benchmarks jaweson.parallel's thread and process pools.
+
+Each payload is serialised serially, and with a thread and a process
+pool, to check the pool 'auto' chooses for it::
+
+    python benchmarks/parallel.py --workers 4
+
+Pools are created before timing, as they are shared between calls.
+Thread pools only run in parallel where the work releases the GIL, so
+compare the results on a machine with at least as many cores as workers.
+
+Run with Python 2 from the repository root, or with jaweson installed.
+"""
+from __future__ import absolute_import, division, print_function
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import jaweson
+from jaweson import json, msgpack, parallel
+
+
+class Record(jaweson.Serialisable):
+    def __init__(self, i):
+        self.id = i
+        self.name = 'record {}'.format(i)
+        self.value = i * 0.5
+
+
+def large_arrays():
+    # 8MB each
+    return 'msgpack', [np.random.rand(1 << 20) for _ in range(16)], {}
+
+
+def compressed_arrays():
+    return 'json', [np.zeros(1 << 16) for _ in range(64)], {'compress': True}
+
+
+def records():
+    return 'json', [Record(i) for i in range(20000)], {}
+
+
+payloads = [
+    ('large_arrays', large_arrays),
+    ('compressed_arrays', compressed_arrays),
+    ('records', records),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if sys.version_info[0] > 2:
+        # serialisers are registered by python 2 metaclasses
+        parser.error('jaweson requires Python 2')
+
+    for name, payload in payloads:
+        format, obj, kwargs = payload()
+        module = json if format == 'json' else msgpack
+        auto = parallel._auto_pool(format, obj, kwargs)
+        for pool in (None, 'thread', 'process'):
+            if pool:
+                # created outside the timed calls
+                parallel._shared_pool(pool, args.workers)
+                f = lambda: module.dumps(obj, workers=args.workers, pool=pool, **kwargs)
+            else:
+                f = lambda: module.dumps(obj, **kwargs)
+            seconds = min(timeit.repeat(f, number=1, repeat=args.repeat))
+            print('{:18} {:8} {:8} {:9.5f}s{}'.format(
+                name, format, pool or 'serial', seconds,
+                ' (auto)' if pool == auto else '',
+            ))
+    parallel.close_pools()
+
+
+if __name__ == '__main__':
+    main()
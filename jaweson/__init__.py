@@ -11,7 +11,23 @@ Note: A badly written class could still parse internal data using eval.
 from __future__ import absolute_import
 from .base import to_dict, from_dict
 from .serialisable import Serialisable
-from .serialiser import Serialiser
-from .serialisers import base, datetime, numpy
+from .serialiser import Serialiser, register_lazy
+from .registry import Registry
+from .profiling import Profile
+from .container import Container
+from .serialisers import base, columns, compression
+
+# serialisers with optional dependencies are imported on first use
+register_lazy(
+    'jaweson.serialisers.datetime',
+    python_types=('datetime.date', 'datetime.time', 'datetime.datetime'),
+    serialised_types=('date', 'time', 'datetime'),
+    ext_types=(1, 2, 3),
+)
+register_lazy(
+    'jaweson.serialisers.numpy',
+    python_types=('numpy.ndarray', 'numpy.generic'),
+    serialised_types=('ndarray', 'npgeneric'),
+)
 
 from .version import __version__
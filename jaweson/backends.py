@@ -0,0 +1,112 @@
+"""Provides the JSON libraries used by jaweson.json.
+
+Each backend wraps a JSON library with the same dumps/loads interface.
+Objects the library does not support natively are passed to jaweson's
+default function, and every decoded dict to jaweson's object_hook, so
+documents use the same type tags whichever backend produced them.
+
+Only libraries which support Python 2 are provided, as jaweson does.
+Types they serialise natively but the standard library does not are
+passed to the default function instead.
+"""
+from __future__ import absolute_import
+import json
+
+
+class JSONBackend(object):
+    '''The standard library json module.
+    '''
+    name = 'json'
+
+    def dumps(self, obj, default, **kwargs):
+        return json.dumps(obj, default=default, **kwargs)
+
+    def loads(self, s, object_hook, **kwargs):
+        return json.loads(s, object_hook=object_hook, **kwargs)
+
+    def dump(self, obj, fp, default, **kwargs):
+        return json.dump(obj, fp, default=default, **kwargs)
+
+    def load(self, fp, object_hook, **kwargs):
+        return json.load(fp, object_hook=object_hook, **kwargs)
+
+    def encoder(self, default, **kwargs):
+        '''Returns a callable(obj) which serialises to a string with
+        the given arguments.
+        '''
+        return json.JSONEncoder(default=default, **kwargs).encode
+
+    def decoder(self, object_hook, **kwargs):
+        '''Returns a callable(s) which deserialises a string with
+        the given arguments.
+        '''
+        return json.JSONDecoder(object_hook=object_hook, **kwargs).decode
+
+
+class SimplejsonBackend(JSONBackend):
+    '''simplejson, which has the standard library's interface.
+    Decimals and namedtuples are passed to the default function and
+    encoded as arrays, as the standard library does.
+    '''
+    name = 'simplejson'
+
+    def __init__(self):
+        import simplejson
+        self.simplejson = simplejson
+
+    def _options(self, kwargs):
+        kwargs.setdefault('use_decimal', False)
+        kwargs.setdefault('namedtuple_as_object', False)
+        return kwargs
+
+    def dumps(self, obj, default, **kwargs):
+        return self.simplejson.dumps(obj, default=default, **self._options(kwargs))
+
+    def loads(self, s, object_hook, **kwargs):
+        return self.simplejson.loads(s, object_hook=object_hook, **kwargs)
+
+    def dump(self, obj, fp, default, **kwargs):
+        return self.simplejson.dump(obj, fp, default=default, **self._options(kwargs))
+
+    def load(self, fp, object_hook, **kwargs):
+        return self.simplejson.load(fp, object_hook=object_hook, **kwargs)
+
+    def encoder(self, default, **kwargs):
+        return self.simplejson.JSONEncoder(default=default, **self._options(kwargs)).encode
+
+    def decoder(self, object_hook, **kwargs):
+        return self.simplejson.JSONDecoder(object_hook=object_hook, **kwargs).decode
+
+
+backends = dict(
+    (backend.name, backend)
+    for backend in (JSONBackend, SimplejsonBackend)
+)
+
+# the order backends are tried in by 'auto'
+preference = ('simplejson', 'json')
+
+_instances = {}
+
+
+def get_backend(name):
+    '''Returns the backend of the given name.
+    'auto' returns the first installed backend in preference order.
+    Raises ImportError if the backend's library is not installed.
+    '''
+    if name == 'auto':
+        for name in preference:
+            try:
+                return get_backend(name)
+            except ImportError:
+                continue
+
+    try:
+        return _instances[name]
+    except KeyError:
+        pass
+
+    if name not in backends:
+        raise ValueError('Unknown JSON backend {}'.format(name))
+    backend = _instances[name] = backends[name]()
+    return backend
@@ -10,6 +10,7 @@ Note: A badly written class could still parse internal data using eval.
 """
 from __future__ import absolute_import
 from . import serialiser
+from .lazy import Lazy, serialise as _serialise_lazy
 import json
 from json import *
 
@@ -18,13 +19,46 @@ def to_dict(obj):
     s = serialiser.find_serialiser(obj)
     if s:
         return s.to_dict(obj)
+    if type(obj) is Lazy:
+        return _serialise_lazy(obj, to_dict)
+
+    raise TypeError('Unable to serialise object of type {}'.format(type(obj)))
+
+
+def to_binary(obj):
+    s = serialiser.find_serialiser(obj)
+    if s:
+        return s.to_binary(obj)
+    if type(obj) is Lazy:
+        return _serialise_lazy(obj, to_binary)
 
     raise TypeError('Unable to serialise object of type {}'.format(type(obj)))
 
 
 def from_dict(jobj):
     if '__type__' in jobj:
-        s = serialiser.find_deserialiser(jobj['__type__'])
-        if s:
-            return s.from_dict(jobj)
+        try:
+            f = serialiser._deserialisers[jobj['__type__']]
+        except (KeyError, TypeError):
+            return serialiser._unknown_serialised_type(jobj)
+        return f(jobj)
     return jobj
+
+
+def make_from_dict(deserialisers):
+    '''Returns a from_dict function which uses the provided
+    dict of serialised type -> callable(jobj) in addition to the
+    registered deserialisers.
+    '''
+    table = dict(serialiser._deserialisers)
+    table.update(deserialisers)
+
+    def from_dict(jobj):
+        if '__type__' in jobj:
+            try:
+                f = table[jobj['__type__']]
+            except (KeyError, TypeError):
+                return serialiser._unknown_serialised_type(jobj)
+            return f(jobj)
+        return jobj
+    return from_dict
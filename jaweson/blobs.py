@@ -0,0 +1,140 @@
+"""Stores large ndarrays in a sidecar blob file.
+
+Arrays above a size threshold are appended to the blob file and replaced
+in the serialised document by a reference::
+
+    {
+        '__type__': 'ndblob',
+        'path': '<blob file, relative to the document>',
+        'offset': <byte offset>,
+        'dtype': '<numpy dtype>',
+        'shape': [<shape>,],
+        'checksum': '<sha1 of the array data>',
+    }
+
+Referenced arrays are loaded as np.memmap, so their data is only read
+from disk when accessed. References are only resolved when requested,
+and their paths must be within the blob directory.
+"""
+from __future__ import absolute_import
+import hashlib
+import os
+import numpy as np
+from .base import to_dict
+
+
+# arrays of at least this many bytes are written to the blob file
+BLOB_THRESHOLD = 1024 * 1024
+
+# array offsets are padded to this alignment
+BLOB_ALIGNMENT = 64
+
+
+def _root(fp=None, root=None):
+    '''Returns the directory blob paths are relative to.
+    '''
+    if root:
+        return root
+    name = getattr(fp, 'name', None)
+    if isinstance(name, (str, type(u''))) and not name.startswith('<'):
+        return os.path.dirname(os.path.abspath(name))
+    return os.getcwd()
+
+
+def _within(root, path):
+    '''Returns the absolute path of a blob reference, raising ValueError
+    if it is absolute, contains '..', or is outside of root.
+    '''
+    if os.path.isabs(path) or os.path.splitdrive(path)[0]:
+        raise ValueError('Blob path {} is not relative'.format(path))
+    if os.pardir in path.replace('\\', '/').split('/'):
+        raise ValueError('Blob path {} contains {}'.format(path, os.pardir))
+    root = os.path.realpath(root)
+    full = os.path.realpath(os.path.join(root, path))
+    if not full.startswith(os.path.join(root, '')):
+        raise ValueError('Blob path {} is outside of {}'.format(path, root))
+    return full
+
+
+class BlobWriter(object):
+    '''Writes large arrays to a blob file, replacing any existing file.
+    The blob file must be within root.
+    Use to_dict as the serialiser default function. Other objects are
+    passed to default.
+    '''
+    def __init__(self, path, threshold=BLOB_THRESHOLD, root=None, default=to_dict):
+        self.path = path
+        self.threshold = threshold
+        self.default = default
+        root = root or os.getcwd()
+        self.ref_path = os.path.relpath(os.path.abspath(path), root)
+        _within(root, self.ref_path)
+        self.f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.f:
+            self.f.close()
+            self.f = None
+
+    def write(self, obj):
+        obj = np.ascontiguousarray(obj)
+        if not self.f:
+            # each dump writes a new blob file
+            self.f = open(self.path, 'wb')
+        offset = self.f.tell()
+        padding = -offset % BLOB_ALIGNMENT
+        if padding:
+            self.f.write(b'\0' * padding)
+            offset += padding
+        self.f.write(memoryview(obj.reshape(-1).view(np.uint8)))
+        return {
+            '__type__': 'ndblob',
+            'path': self.ref_path,
+            'offset': offset,
+            'dtype': obj.dtype.str,
+            'shape': obj.shape,
+            'checksum': hashlib.sha1(obj.reshape(-1).view(np.uint8)).hexdigest(),
+        }
+
+    def to_dict(self, obj):
+        if (
+            isinstance(obj, np.ndarray)
+            and obj.nbytes >= self.threshold
+            and not obj.dtype.hasobject
+        ):
+            return self.write(obj)
+        return self.default(obj)
+
+
+class BlobReader(object):
+    '''Loads blob references as memory mapped arrays.
+    Paths must be relative and within root, or ValueError is raised.
+    mode is passed to np.memmap and defaults to read-only.
+    '''
+    def __init__(self, root=None, mode=None, verify=False):
+        self.root = root
+        self.mode = mode or 'r'
+        self.verify = verify
+
+    def from_dict(self, jobj):
+        path = _within(self.root or os.getcwd(), jobj['path'])
+
+        shape = tuple(jobj['shape'])
+        obj = np.memmap(
+            path,
+            dtype=np.dtype(jobj['dtype']),
+            mode=self.mode,
+            offset=jobj['offset'],
+            shape=shape,
+        )
+        if self.verify:
+            checksum = hashlib.sha1(obj.reshape(-1).view(np.uint8)).hexdigest()
+            if checksum != jobj['checksum']:
+                raise ValueError('Checksum mismatch for blob {} at offset {}'.format(path, jobj['offset']))
+        return obj
@@ -0,0 +1,297 @@
+"""Stores many objects in a single file, each of which can be loaded
+without parsing the others.
+
+Each object is serialised as an independent frame with the json or
+msgpack module, and a trailing index maps each key to its frame::
+
+    <header: 'JAWESONC', uint8 version, format name>
+    <frame>
+    <frame>
+    ...
+    <index: [[key, offset, length], ...] serialised with the format>
+    <footer: uint64 index offset, uint64 index length, 'JAWESONI'>
+
+Keys are strings or integers. A key which is written again points to
+the new frame, the old frame remains in the file until it is rewritten
+with copy.
+
+Frames are only ever written at the end of the file, after any existing
+index, and a new index and footer are written after them when the
+container is flushed or closed. A container which is not closed after
+writing has no index at its end and can't be opened, but the file up to
+its previous footer is unchanged. Replaced indexes remain in the file
+until it is rewritten with copy.
+"""
+from __future__ import absolute_import
+import json as stdlib_json
+import mmap
+import os
+import struct
+import threading
+
+MAGIC = b'JAWESONC'
+INDEX_MAGIC = b'JAWESONI'
+VERSION = 1
+
+# magic, version, format
+_header = struct.Struct('<8sB7s')
+# index offset, index length, magic
+_footer = struct.Struct('<QQ8s')
+
+_text_type = type(u'')
+try:
+    _int_types = (int, long)
+except NameError:
+    # python 3
+    _int_types = (int,)
+_key_types = _int_types + (str, _text_type)
+
+
+def _module(format):
+    if format == 'json':
+        from . import json
+        return json
+    if format == 'msgpack':
+        from . import msgpack
+        return msgpack
+    raise ValueError('Unknown format {}'.format(format))
+
+
+def _dump_index(format, entries):
+    if format == 'json':
+        return stdlib_json.dumps(entries, separators=(',', ':')).encode('utf-8')
+    import msgpack
+    return msgpack.packb(entries, use_bin_type=True)
+
+
+def _load_index(format, data):
+    if format == 'json':
+        return stdlib_json.loads(data.decode('utf-8'))
+    import msgpack
+    return msgpack.unpackb(data, raw=False)
+
+
+class Container(object):
+    '''A file of independently serialised objects, indexed by key.
+
+    mode is 'r' to read, 'w' to create or truncate the file, or 'a' to
+    append to the file, creating it if it doesn't exist.
+    format is 'json' or 'msgpack', and is read from existing files.
+    If use_mmap is True, frames are read from a memory map of the file
+    rather than with a seek and read for each object.
+
+    Containers are safe to read from multiple threads, but not to write.
+    '''
+    def __init__(self, path, mode='r', format='json', use_mmap=False):
+        if mode not in ('r', 'w', 'a'):
+            raise ValueError('Unknown mode {}'.format(mode))
+        _module(format)
+
+        self.path = path
+        self.mode = mode
+        self.format = format
+        # key -> (offset, length)
+        self.index = {}
+        # the key returned by the next append
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self._mmap = None
+
+        if mode == 'a' and not os.path.exists(path):
+            mode = 'w'
+        self.f = open(path, {'r': 'rb', 'w': 'w+b', 'a': 'r+b'}[mode])
+        try:
+            if mode == 'w':
+                self.f.write(_header.pack(MAGIC, VERSION, format.encode('ascii')))
+                self._end = self.f.tell()
+            else:
+                self._read_index()
+            if use_mmap and self.mode == 'r':
+                self._mmap = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        except:
+            self.f.close()
+            raise
+        # False once the index on disk is current
+        self._dirty = mode == 'w'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _read_index(self):
+        header = self.f.read(_header.size)
+        if len(header) < _header.size:
+            raise ValueError('{} is not a jaweson container'.format(self.path))
+        magic, version, format = _header.unpack(header)
+        if magic != MAGIC:
+            raise ValueError('{} is not a jaweson container'.format(self.path))
+        if version > VERSION:
+            raise ValueError('Unsupported container version {}'.format(version))
+        self.format = format.rstrip(b'\0').decode('ascii')
+
+        self.f.seek(0, os.SEEK_END)
+        size = self.f.tell()
+        if size < _header.size + _footer.size:
+            raise ValueError('{} has no index, it was not closed after writing'.format(self.path))
+        self.f.seek(size - _footer.size)
+        offset, length, magic = _footer.unpack(self.f.read(_footer.size))
+        if magic != INDEX_MAGIC or offset + length + _footer.size != size:
+            raise ValueError('{} has no index, it was not closed after writing'.format(self.path))
+
+        self.f.seek(offset)
+        index = {}
+        try:
+            for key, frame_offset, frame_length in _load_index(self.format, self.f.read(length)):
+                if not isinstance(key, _key_types) or isinstance(key, bool):
+                    raise ValueError('invalid key {!r}'.format(key))
+                if frame_offset < _header.size or frame_length < 0 or frame_offset + frame_length > offset:
+                    raise ValueError('invalid frame of {!r}'.format(key))
+                index[key] = (frame_offset, frame_length)
+        except (ValueError, TypeError) as e:
+            # ie, a torn write, or data which isn't an index
+            raise ValueError('{} has an invalid index: {}'.format(self.path, e))
+        self.index = index
+        self._next_key = max([k for k in index if isinstance(k, _int_types) and not isinstance(k, bool)] or [-1]) + 1
+        # new frames are written after the index
+        self._end = size
+
+    def _open(self):
+        if self.f is None:
+            raise ValueError('Container {} is closed'.format(self.path))
+
+    def _writable(self):
+        self._open()
+        if self.mode == 'r':
+            raise IOError('Container {} is open for reading'.format(self.path))
+
+    def _read(self, offset, length):
+        self._open()
+        if self._mmap is not None:
+            return self._mmap[offset:offset + length]
+        with self._lock:
+            self.f.seek(offset)
+            return self.f.read(length)
+
+    def put(self, key, obj, **kwargs):
+        '''Serialises the object as the value of key.
+        kwargs are passed to the format's dumps.
+        '''
+        self._writable()
+        if not isinstance(key, _key_types) or isinstance(key, bool):
+            raise TypeError('Container keys must be strings or integers, not {}'.format(type(key)))
+        try:
+            # checked before writing the frame, as the index is written on flush
+            _dump_index(self.format, [[key, 0, 0]])
+        except ValueError as e:
+            # ie, a str key which isn't utf-8 in a json container
+            raise ValueError('Container key {!r} can\'t be stored in the {} index: {}'.format(key, self.format, e))
+
+        data = _module(self.format).dumps(obj, **kwargs)
+        if isinstance(data, _text_type):
+            data = data.encode('utf-8')
+        self._write(key, data)
+
+    def _write(self, key, data):
+        self.f.seek(self._end)
+        self.f.write(data)
+        self.index[key] = (self._end, len(data))
+        self._end += len(data)
+        self._dirty = True
+        if isinstance(key, _int_types) and not isinstance(key, bool) and key >= self._next_key:
+            self._next_key = key + 1
+
+    def append(self, obj, **kwargs):
+        '''Serialises the object with the next integer key, which is returned.
+        '''
+        key = self._next_key
+        self.put(key, obj, **kwargs)
+        return key
+
+    def get(self, key, default=None, **kwargs):
+        '''Deserialises the value of key, or returns default if there isn't one.
+        kwargs are passed to the format's loads.
+        '''
+        try:
+            offset, length = self.index[key]
+        except KeyError:
+            return default
+        data = self._read(offset, length)
+        if self.format == 'json':
+            data = data.decode('utf-8')
+        return _module(self.format).loads(data, **kwargs)
+
+    def __getitem__(self, key):
+        if key not in self.index:
+            raise KeyError(key)
+        return self.get(key)
+
+    def __setitem__(self, key, obj):
+        self.put(key, obj)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        '''Returns the keys in the order their frames were written.
+        '''
+        return sorted(self.index, key=lambda k: self.index[k][0])
+
+    def items(self, **kwargs):
+        '''Yields each (key, object) in the order their frames were written.
+        '''
+        for key in self.keys():
+            yield key, self.get(key, **kwargs)
+
+    def copy(self, path, format=None, **kwargs):
+        '''Writes the current value of each key to a new container,
+        omitting frames which have been replaced.
+        If format differs from this container's, the objects are
+        deserialised and serialised again. Otherwise frames are copied.
+        '''
+        format = format or self.format
+        with Container(path, 'w', format) as target:
+            for key in self.keys():
+                if format == self.format and not kwargs:
+                    target._write(key, self._read(*self.index[key]))
+                else:
+                    target.put(key, self.get(key), **kwargs)
+
+    def flush(self):
+        '''Writes the index, so the container can be opened while more
+        objects are written.
+        '''
+        if self.mode == 'r' or not self._dirty:
+            return
+        entries = [
+            [key, offset, length]
+            for key, (offset, length) in sorted(self.index.items(), key=lambda kv: kv[1][0])
+        ]
+        data = _dump_index(self.format, entries)
+        self.f.seek(self._end)
+        self.f.write(data)
+        self.f.write(_footer.pack(self._end, len(data), INDEX_MAGIC))
+        self.f.flush()
+        # later frames are written after this index
+        self._end = self.f.tell()
+        self._dirty = False
+
+    def close(self):
+        if self.f is None:
+            return
+        try:
+            self.flush()
+        finally:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self.f.close()
+            self.f = None
+
@@ -1,26 +1,634 @@
 from __future__ import absolute_import
-from .base import from_dict, to_dict
+from .base import from_dict, to_dict, make_from_dict
 from .serialisable import Serialisable
-from .serialiser import Serialiser
+from .serialiser import Serialiser, find_serialiser
+from .serialisers.columns import to_columns, column_dict
+from .registry import Registry
+from . import backends, profiling
 import json as serialiser
+import re
+try:
+    from collections.abc import Iterator as _Iterator
+except ImportError:
+    from collections import Iterator as _Iterator
 from json import *
 
 
-def load(*args, **kwargs):
+# the backend used by dump, dumps, load and loads
+_backend = backends.get_backend('json')
+
+
+def set_backend(name):
+    '''Sets the JSON library used by dump, dumps, load and loads.
+    name is one of 'json', 'simplejson', or 'auto'
+    for the fastest installed library.
+    Raises ImportError if the library is not installed.
+    '''
+    global _backend
+    _backend = backends.get_backend(name)
+
+
+def _get_backend(kwargs):
+    '''Returns the backend requested with the backend argument,
+    or the backend set with set_backend.
+    '''
+    name = kwargs.pop('backend', None)
+    if name is None:
+        return _backend
+    return backends.get_backend(name)
+
+
+def _blob_hook(kwargs, fp=None):
+    '''Wraps the object_hook to resolve blob references if blobs or
+    another blob option was requested. Blob paths are relative to
+    blob_dir, or the directory of fp.
+    '''
+    blobs = kwargs.pop('blobs', False)
+    blob_dir = kwargs.pop('blob_dir', None)
+    blob_mode = kwargs.pop('blob_mode', None)
+    blob_verify = kwargs.pop('blob_verify', False)
+    if not (blobs or blob_dir is not None or blob_mode is not None or blob_verify):
+        return
+
+    from . import blobs
+    reader = blobs.BlobReader(blobs._root(fp, blob_dir), blob_mode, blob_verify)
+    hook = kwargs['object_hook']
+
+    def object_hook(jobj):
+        if jobj.get('__type__') == 'ndblob':
+            return reader.from_dict(jobj)
+        return hook(jobj)
+    kwargs['object_hook'] = object_hook
+
+
+def _blob_writer(kwargs, fp=None):
+    '''Returns a BlobWriter if a blob_file was requested.
+    '''
+    blob_file = kwargs.pop('blob_file', None)
+    blob_dir = kwargs.pop('blob_dir', None)
+    blob_threshold = kwargs.pop('blob_threshold', None)
+    if not blob_file:
+        return None
+
+    from . import blobs
+    return blobs.BlobWriter(
+        blob_file,
+        blob_threshold or blobs.BLOB_THRESHOLD,
+        blobs._root(fp, blob_dir),
+        kwargs['default'],
+    )
+
+
+def _compression_encoder(kwargs):
+    '''Wraps the default function with a CompressionEncoder if compress was requested.
+    compress is the codec name, or True for zlib.
+    '''
+    codec = kwargs.pop('compress', None)
+    threshold = kwargs.pop('compress_threshold', None)
+    if not codec:
+        return
+
+    from .serialisers import compression
+    kwargs['default'] = compression.CompressionEncoder(
+        kwargs['default'],
+        'zlib' if codec is True else codec,
+        threshold or compression.COMPRESS_THRESHOLD,
+    ).default
+
+
+def _profile_encoder(kwargs):
+    '''Wraps the default function with the requested Profile, or the
+    Profile entered on this thread.
+    '''
+    profile = kwargs.pop('profile', None) or profiling.active()
+    if profile:
+        kwargs['default'] = profile.default(kwargs['default'])
+
+
+def _decompression_decoder(kwargs):
+    '''Wraps the object_hook with a CompressionDecoder if decompress was requested.
+    decompress is True, or the maximum decompressed size of each value in bytes.
+    '''
+    max_size = kwargs.pop('decompress', None)
+    if not max_size:
+        return
+
+    from .serialisers import compression
+    kwargs['object_hook'] = compression.CompressionDecoder(
+        kwargs['object_hook'],
+        compression.MAX_DECOMPRESSED_SIZE if max_size is True else max_size,
+    ).from_dict
+
+
+def _profile_decoder(kwargs):
+    '''Wraps the object_hook with the requested Profile, or the
+    Profile entered on this thread.
+    '''
+    profile = kwargs.pop('profile', None) or profiling.active()
+    if profile:
+        kwargs['object_hook'] = profile.object_hook(kwargs['object_hook'])
+
+
+def _lazy_decoder(kwargs):
+    '''Wraps the object_hook with a LazyDecoder if lazy was requested.
+    lazy is True for the default lazy types, or a list of serialised types.
+    '''
+    lazy = kwargs.pop('lazy', None)
+    if not lazy:
+        return
+
+    from .lazy import LazyDecoder, LAZY_TYPES
+    decoder = LazyDecoder(kwargs['object_hook'], LAZY_TYPES if lazy is True else lazy)
+    kwargs['object_hook'] = decoder.from_dict
+
+
+def _reference_decoder(kwargs):
+    '''Wraps the object_hook with a ReferenceDecoder if refs was requested.
+    '''
+    if not kwargs.pop('refs', False):
+        return None
+
+    from .references import ReferenceDecoder
+    decoder = ReferenceDecoder(kwargs['object_hook'])
+    kwargs['object_hook'] = decoder.from_dict
+    return decoder
+
+
+def _reference_encoder(kwargs):
+    '''Wraps the default function with a ReferenceEncoder if refs was requested.
+    '''
+    if not kwargs.pop('refs', False):
+        return
+
+    from .references import ReferenceEncoder
+    encoder = ReferenceEncoder(kwargs['default'])
+    kwargs['default'] = encoder.default
+    # cycles are serialised as references
+    kwargs['check_circular'] = False
+
+
+def _schema_decoder(kwargs):
+    '''Wraps the object_hook with a SchemaDecoder if compact was requested.
+    '''
+    if not kwargs.pop('compact', False):
+        return
+
+    from .schemas import SchemaDecoder
+    kwargs['object_hook'] = SchemaDecoder(kwargs['object_hook']).from_dict
+
+
+def _schema_encoder(kwargs):
+    '''Wraps the default function with a SchemaEncoder if compact was requested.
+    '''
+    if not kwargs.pop('compact', False):
+        return None
+
+    from .schemas import SchemaEncoder
+    encoder = SchemaEncoder(kwargs['default'])
+    kwargs['default'] = encoder.default
+    return encoder
+
+
+def _schema_header(backend, encoder, data, kwargs):
+    '''Writes the compact envelope around the serialised document.
+    The schema table must precede the document, but is only complete once
+    the document is serialised, so each member of the envelope is encoded
+    with the document's arguments and written out explicitly.
+    The document itself is written as it was serialised, so with indent
+    it is not indented to its depth in the envelope.
+    '''
+    kwargs = dict(kwargs)
+    del kwargs['default']
+    kwargs.pop('sort_keys', None)
+
+    indent = kwargs.get('indent')
+    if indent is None:
+        newline = end = ''
+        item_separator, key_separator = ', ', ': '
+    else:
+        if not isinstance(indent, (str, type(u''))):
+            indent = ' ' * indent
+        newline, end = '\n' + indent, '\n'
+        item_separator, key_separator = ',', ': '
+    if kwargs.get('separators'):
+        item_separator, key_separator = kwargs['separators']
+
+    members = [
+        ('__type__', backend.dumps('compact', to_dict, **kwargs)),
+        ('schemas', backend.dumps(encoder.schemas, to_dict, **kwargs)),
+        ('data', data),
+    ]
+    return '{' + newline + (item_separator + newline).join(
+        backend.dumps(k, to_dict, **kwargs) + key_separator + v
+        for k, v in members
+    ) + end + '}'
+
+
+def load(fp, *args, **kwargs):
+    backend = _get_backend(kwargs)
     kwargs['object_hook'] = from_dict
-    return serialiser.load(*args, **kwargs)
+    _blob_hook(kwargs, fp)
+    _decompression_decoder(kwargs)
+    _profile_decoder(kwargs)
+    _lazy_decoder(kwargs)
+    _schema_decoder(kwargs)
+    decoder = _reference_decoder(kwargs)
+    obj = backend.load(fp, *args, **kwargs)
+    return decoder.resolve(obj) if decoder else obj
 
 
 def loads(*args, **kwargs):
+    backend = _get_backend(kwargs)
     kwargs['object_hook'] = from_dict
-    return serialiser.loads(*args, **kwargs)
+    _blob_hook(kwargs)
+    _decompression_decoder(kwargs)
+    _profile_decoder(kwargs)
+    _lazy_decoder(kwargs)
+    _schema_decoder(kwargs)
+    decoder = _reference_decoder(kwargs)
+    obj = backend.loads(*args, **kwargs)
+    return decoder.resolve(obj) if decoder else obj
 
 
-def dump(*args, **kwargs):
+def dump(obj, fp, *args, **kwargs):
+    backend = _get_backend(kwargs)
     kwargs['default'] = to_dict
-    return serialiser.dump(*args, **kwargs)
+    _profile_encoder(kwargs)
+    _compression_encoder(kwargs)
+    writer = _blob_writer(kwargs, fp)
+    if writer:
+        kwargs['default'] = writer.to_dict
+    encoder = _schema_encoder(kwargs)
+    _reference_encoder(kwargs)
+    try:
+        if encoder:
+            # the schema table is only complete once the document is serialised
+            data = backend.dumps(obj, *args, **kwargs)
+            return fp.write(_schema_header(backend, encoder, data, kwargs))
+        return backend.dump(obj, fp, *args, **kwargs)
+    finally:
+        if writer:
+            writer.close()
 
 
 def dumps(*args, **kwargs):
+    workers = kwargs.pop('workers', None)
+    pool = kwargs.pop('pool', 'auto')
+    if workers:
+        # see jaweson.parallel
+        from . import parallel
+        return parallel.dumps(*args, format='json', workers=workers, pool=pool, **kwargs)
+
+    backend = _get_backend(kwargs)
     kwargs['default'] = to_dict
-    return serialiser.dumps(*args, **kwargs)
+    _profile_encoder(kwargs)
+    _compression_encoder(kwargs)
+    writer = _blob_writer(kwargs)
+    if writer:
+        kwargs['default'] = writer.to_dict
+    encoder = _schema_encoder(kwargs)
+    _reference_encoder(kwargs)
+    try:
+        data = backend.dumps(*args, **kwargs)
+        if encoder:
+            return _schema_header(backend, encoder, data, kwargs)
+        return data
+    finally:
+        if writer:
+            writer.close()
+
+
+def dumps_batch(objs, **kwargs):
+    '''Serialises a list of Serialisable objects of a single class
+    as columns of field values. See jaweson.serialisers.columns.
+    '''
+    return dumps(to_columns(objs), **kwargs)
+
+
+def loads_batch(s, columns=False, **kwargs):
+    '''Deserialises a batch serialised with dumps_batch.
+    If columns is True, a dict of field -> column is returned
+    instead of the list of objects.
+    '''
+    if not columns:
+        return loads(s, **kwargs)
+    backend = _get_backend(kwargs)
+    kwargs['object_hook'] = make_from_dict({'columns': column_dict})
+    _profile_decoder(kwargs)
+    return backend.loads(s, **kwargs)
+
+
+class Encoder(object):
+    '''Serialises objects with a fixed Registry, backend and arguments.
+    registry defaults to a snapshot of the registered serialisers, and
+    backend to the backend set with set_backend.
+    kwargs are passed to the backend, ie, indent or sort_keys.
+    refs, compact and blobs are only supported by dump and dumps.
+    profile is a Profile which records every object serialised.
+    Encoders are safe to share between threads.
+    '''
+    def __init__(self, registry=None, backend=None, profile=None, **kwargs):
+        self.registry = registry or Registry()
+        self.backend = backends.get_backend(backend) if backend else _backend
+        default = self.registry.to_dict
+        if profile:
+            default = profile.default(default)
+        self._encode = self.backend.encoder(default, **kwargs)
+
+    def dumps(self, obj):
+        return self._encode(obj)
+
+    def dump(self, obj, fp):
+        return fp.write(self._encode(obj))
+
+
+class Decoder(object):
+    '''Deserialises objects with a fixed Registry, backend and arguments.
+    See Encoder.
+    blobs and the other blob options resolve blob references as loads does,
+    relative to blob_dir or the current directory.
+    '''
+    def __init__(self, registry=None, backend=None, profile=None, **kwargs):
+        self.registry = registry or Registry()
+        self.backend = backends.get_backend(backend) if backend else _backend
+        kwargs['object_hook'] = self.registry.from_dict
+        _blob_hook(kwargs)
+        _decompression_decoder(kwargs)
+        object_hook = kwargs.pop('object_hook')
+        if profile:
+            object_hook = profile.object_hook(object_hook)
+        self._decode = self.backend.decoder(object_hook, **kwargs)
+
+    def loads(self, s):
+        return self._decode(s)
+
+    def load(self, fp):
+        return self._decode(fp.read())
+
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+# iterencode coalesces output into chunks of at least this many characters
+CHUNK_SIZE = 64 * 1024
+
+
+class _IteratorList(list):
+    '''Presents an iterator as a list, so the encoder streams it as
+    a JSON array without materialising it.
+    '''
+    def __init__(self, iterator):
+        super(_IteratorList, self).__init__()
+        self.iterator = iterator
+        self.head = []
+        for value in iterator:
+            self.head.append(value)
+            break
+
+    def __iter__(self):
+        for value in self.head:
+            yield value
+        for value in self.iterator:
+            yield value
+
+    def __len__(self):
+        return len(self.head)
+
+    def __nonzero__(self):
+        return bool(self.head)
+    __bool__ = __nonzero__
+
+
+def _stream_default(obj):
+    if isinstance(obj, _Iterator) and find_serialiser(obj) is None:
+        return _IteratorList(obj)
+    return to_dict(obj)
+
+
+def iterencode(obj, chunk_size=CHUNK_SIZE, **kwargs):
+    '''Encodes the object incrementally, yielding chunks of output.
+    Serialisers are called as each object is reached, and generators
+    and other iterators are encoded as arrays as they are consumed.
+    '''
+    kwargs['default'] = _stream_default
+    _profile_encoder(kwargs)
+    cls = kwargs.pop('cls', None) or serialiser.JSONEncoder
+    buf = []
+    size = 0
+    for chunk in cls(**kwargs).iterencode(obj):
+        buf.append(chunk)
+        size += len(chunk)
+        if size >= chunk_size:
+            yield ''.join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield ''.join(buf)
+
+
+def dump_stream(obj, fp, chunk_size=CHUNK_SIZE, **kwargs):
+    '''Writes the object to fp incrementally.
+    See iterencode.
+    '''
+    for chunk in iterencode(obj, chunk_size, **kwargs):
+        fp.write(chunk)
+
+
+# structural characters outside of strings, and the end of a string or an escape
+_structure = re.compile(r'[][{}"]')
+_string_end = re.compile(r'["\\]')
+# the end of a scalar value
+_scalar_end = re.compile(r'[ \t\n\r,\]}]')
+
+
+class FeedDecoder(object):
+    '''Incrementally decodes JSON as data is received, without blocking
+    on reads. For use with event loops and non-blocking sockets.
+
+    feed returns the deserialised values completed by each chunk of data.
+    close returns the last value once all data has been received, and
+    raises ValueError if the data is incomplete.
+
+    If the input is a top-level JSON array, its items are returned.
+    Otherwise each value of newline-delimited or concatenated JSON is returned.
+    array can be set to True or False to avoid detecting the format.
+    '''
+    def __init__(self, array=None, **kwargs):
+        kwargs['object_hook'] = from_dict
+        _decompression_decoder(kwargs)
+        _profile_decoder(kwargs)
+        _lazy_decoder(kwargs)
+        self.decoder = serialiser.JSONDecoder(**kwargs)
+        self.array = array
+        # array state, the expected character or 'item'
+        # None once the array is closed
+        self.expect = '['
+        self.buf = ''
+        self.pos = 0
+        # chunks of a partially received container or string
+        # these are only joined once the value is complete, and each
+        # character is scanned once however the data is split
+        self.pending = []
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, data):
+        if not data:
+            return []
+
+        if self.pending:
+            end = self._scan(data, 0)
+            self.pending.append(data)
+            if end is None:
+                return []
+            self.buf = ''.join(self.pending)
+            self.pos = 0
+            self.pending = []
+            values = [self._complete(self.decoder.raw_decode(self.buf, 0))]
+            return values + self._decode(False)
+
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return self._decode(False)
+
+    def close(self):
+        if self.pending:
+            raise ValueError('Unterminated JSON value')
+        values = self._decode(True)
+        if self.array and self.expect is not None:
+            raise ValueError('Unterminated JSON array')
+        return values
+
+    def _scan(self, s, i):
+        '''Scans s from i for the end of the current container or string.
+        Returns the end, or None if it hasn't been received yet.
+        '''
+        if self.escape:
+            self.escape = False
+            i += 1
+        depth = self.depth
+        in_string = self.in_string
+        end = None
+        while end is None:
+            if in_string:
+                m = _string_end.search(s, i)
+                if not m:
+                    break
+                i = m.end()
+                if m.group() == '\\':
+                    if i == len(s):
+                        # the escaped character is in the next chunk
+                        self.escape = True
+                        break
+                    i += 1
+                    continue
+                in_string = False
+                if not depth:
+                    end = i
+            else:
+                m = _structure.search(s, i)
+                if not m:
+                    break
+                c = m.group()
+                i = m.end()
+                if c == '"':
+                    in_string = True
+                elif c in '[{':
+                    depth += 1
+                else:
+                    depth -= 1
+                    if not depth:
+                        end = i
+
+        self.depth = depth
+        self.in_string = in_string
+        return end
+
+    def _complete(self, value):
+        obj, self.pos = value
+        if self.array:
+            self.expect = ','
+        return obj
+
+    def _value(self, eof):
+        '''Decodes the value at pos, returning (obj, end), or None if
+        it hasn't been received yet.
+        '''
+        if self.buf[self.pos] in '[{"':
+            try:
+                return self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if eof:
+                    raise
+            # the value is incomplete or invalid, scan it so the rest is
+            # only decoded once it has been received
+            self.depth = 0
+            self.in_string = False
+            self.escape = False
+            if self._scan(self.buf, self.pos) is not None:
+                # complete, so invalid
+                return self.decoder.raw_decode(self.buf, self.pos)
+            self.pending.append(self.buf[self.pos:])
+            self.buf = ''
+            self.pos = 0
+            return None
+
+        # scalars are short, and are decoded once they're followed
+        # by a delimiter or the end of the input
+        if not eof and not _scalar_end.search(self.buf, self.pos):
+            return None
+        return self.decoder.raw_decode(self.buf, self.pos)
+
+    def _decode(self, eof):
+        values = []
+        while True:
+            self.pos = _whitespace.match(self.buf, self.pos).end()
+            if self.pos >= len(self.buf):
+                return values
+
+            c = self.buf[self.pos]
+            if self.array is None:
+                self.array = c == '['
+            if self.array:
+                if self.expect is None:
+                    raise ValueError('Extra data after JSON array')
+                if self.expect == '[':
+                    if c != '[':
+                        raise ValueError('Expecting a JSON array')
+                    self.pos += 1
+                    self.expect = ']'
+                    continue
+                if self.expect == ',':
+                    if c not in ',]':
+                        raise ValueError('Expecting , delimiter')
+                    self.pos += 1
+                    self.expect = 'item' if c == ',' else None
+                    continue
+                if self.expect == ']' and c == ']':
+                    self.pos += 1
+                    self.expect = None
+                    continue
+
+            value = self._value(eof)
+            if value is None:
+                return values
+            values.append(self._complete(value))
+
+
+def iterload(fp, array=None, chunk_size=CHUNK_SIZE, **kwargs):
+    '''Incrementally decodes fp, yielding deserialised values one at a time.
+    If the input is a top-level JSON array, its items are yielded.
+    Otherwise each value of newline-delimited or concatenated JSON is yielded.
+    array can be set to True or False to avoid detecting the format
+    (ie, for newline-delimited JSON arrays).
+    See FeedDecoder for decoding without blocking reads.
+    '''
+    decoder = FeedDecoder(array, **kwargs)
+    while True:
+        data = fp.read(chunk_size)
+        if not data:
+            break
+        for obj in decoder.feed(data):
+            yield obj
+    for obj in decoder.close():
+        yield obj
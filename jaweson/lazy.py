@@ -0,0 +1,178 @@
+"""Provides lazy deserialisation of expensive values.
+
+Serialised values of the chosen types are returned as Lazy proxies,
+which deserialise the value on first use and cache it. Attribute
+access, operators, iteration, numpy's __array__ and isinstance checks
+are forwarded to the value::
+
+    obj = json.loads(j, lazy=True)
+    obj['weights']                  # Lazy proxy, not yet decoded
+    obj['weights'].mean()           # decodes the ndarray
+    materialise(obj['weights'])     # the ndarray itself
+
+Proxies are serialised as their value. They are not callable, so they
+are not skipped as methods when their object is serialised again.
+
+Values nested inside a lazy value are deserialised when the document is
+loaded, as object hooks are called innermost first.
+"""
+from __future__ import absolute_import
+
+try:
+    _native_types = (type(None), bool, int, long, float, bytes, unicode, bytearray, list, tuple, dict)
+except NameError:
+    # python 3
+    _native_types = (type(None), bool, int, float, bytes, str, bytearray, list, tuple, dict)
+
+
+# serialised types which are lazy for lazy=True
+LAZY_TYPES = ('ndarray', 'npgeneric', 'compressed')
+
+_unset = object()
+
+
+class Lazy(object):
+    '''A proxy for a serialised value which is deserialised on first use.
+    '''
+    __slots__ = ('_from_dict', '_jobj', '_value')
+
+    def __init__(self, from_dict, jobj):
+        object.__setattr__(self, '_from_dict', from_dict)
+        object.__setattr__(self, '_jobj', jobj)
+        object.__setattr__(self, '_value', _unset)
+
+    def _materialise(self):
+        value = self._value
+        if value is _unset:
+            value = self._from_dict(self._jobj)
+            object.__setattr__(self, '_value', value)
+            # release the serialised data
+            object.__setattr__(self, '_jobj', None)
+        return value
+
+    @property
+    def __class__(self):
+        return self._materialise().__class__
+
+    def __getattr__(self, key):
+        return getattr(self._materialise(), key)
+
+    def __setattr__(self, key, value):
+        setattr(self._materialise(), key, value)
+
+    def __delattr__(self, key):
+        delattr(self._materialise(), key)
+
+    def __dir__(self):
+        return dir(self._materialise())
+
+    def __repr__(self):
+        if self._value is _unset:
+            return '<Lazy {}>'.format(self._jobj.get('__type__'))
+        return repr(self._value)
+
+    def __hash__(self):
+        return hash(self._materialise())
+
+    def __nonzero__(self):
+        return bool(self._materialise())
+    __bool__ = __nonzero__
+
+    def __reduce__(self):
+        return _value, (self._materialise(),)
+
+
+def _value(value):
+    return value
+
+
+def _forward(name):
+    def method(self, *args):
+        return getattr(self._materialise(), name)(*args)
+    method.__name__ = name
+    return method
+
+
+def _forward_operator(name):
+    def method(self, *args):
+        f = getattr(self._materialise(), name, None)
+        if f is None:
+            # lets python try the reflected or non in-place operator
+            return NotImplemented
+        return f(*args)
+    method.__name__ = name
+    return method
+
+
+# special methods are looked up on the type, so each is forwarded
+for _name in (
+    '__str__', '__format__',
+    '__len__', '__iter__', '__reversed__', '__contains__',
+    '__getitem__', '__setitem__', '__delitem__',
+    '__enter__', '__exit__',
+    '__int__', '__long__', '__float__', '__complex__', '__index__',
+    '__neg__', '__pos__', '__abs__', '__invert__',
+):
+    setattr(Lazy, _name, _forward(_name))
+
+for _name in ('__eq__', '__ne__', '__lt__', '__le__', '__gt__', '__ge__'):
+    setattr(Lazy, _name, _forward_operator(_name))
+
+for _op in (
+    'add', 'sub', 'mul', 'div', 'truediv', 'floordiv', 'mod', 'divmod',
+    'pow', 'lshift', 'rshift', 'and', 'or', 'xor', 'matmul',
+):
+    for _name in ('__{}__', '__r{}__', '__i{}__'):
+        _name = _name.format(_op)
+        setattr(Lazy, _name, _forward_operator(_name))
+
+
+def _getslice(self, i, j):
+    # python 2 slices types with __getslice__ through it
+    return self._materialise()[i:j]
+Lazy.__getslice__ = _getslice
+
+
+def _array(self, *args):
+    import numpy as np
+    return np.asarray(self._materialise(), *args)
+Lazy.__array__ = _array
+
+
+def materialise(obj):
+    '''Returns the value of a Lazy proxy, or obj if it isn't one.
+    '''
+    if type(obj) is Lazy:
+        return obj._materialise()
+    return obj
+
+
+def serialise(obj, default):
+    '''Returns the value of a Lazy proxy for an encoder's default function.
+    Values the encoder packs natively (ie, decompressed strings) are
+    returned as they are, and others are serialised with default.
+    '''
+    value = obj._materialise()
+    if isinstance(value, _native_types):
+        return value
+    return default(value)
+
+
+def is_lazy(obj):
+    '''Returns True if obj is a Lazy proxy which has not been deserialised yet.
+    '''
+    return type(obj) is Lazy and obj._value is _unset
+
+
+class LazyDecoder(object):
+    '''Wraps a from_dict function, returning Lazy proxies for serialised
+    values of the given types.
+    '''
+    def __init__(self, from_dict, types=LAZY_TYPES):
+        self._from_dict = from_dict
+        self.types = frozenset(types)
+
+    def from_dict(self, jobj):
+        if jobj.get('__type__') in self.types:
+            return Lazy(self._from_dict, jobj)
+        return self._from_dict(jobj)
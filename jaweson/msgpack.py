@@ -1,29 +1,503 @@
 from __future__ import absolute_import
 try:
-    from .base import from_dict, to_dict
+    from .base import from_dict, to_dict, to_binary, make_from_dict
     from .serialisable import Serialisable
     from .serialiser import Serialiser
+    from . import serialiser as _registry
+    from .registry import Registry
+    from . import profiling
+    from .serialisers.columns import to_columns, column_dict
+    from .serialisers.base import EXT_SET, EXT_TUPLE
+    from .lazy import Lazy, serialise as _serialise_lazy
     import msgpack as serialiser
+    import threading
     from msgpack import *
 
 
+    def default(obj):
+        '''Serialises objects as extension types where the serialiser
+        supports them, and to_binary otherwise.
+        '''
+        s = _registry.find_serialiser(obj)
+        if s:
+            ext = s.to_ext(obj)
+            if ext is not None:
+                # skips ExtType's argument checks, which are slow
+                return tuple.__new__(ExtType, ext)
+        elif type(obj) is Lazy:
+            return _serialise_lazy(obj, default)
+        return to_binary(obj)
+
+
+    def ext_hook(code, data):
+        f = _registry._ext_deserialisers.get(code)
+        if f:
+            return f(data)
+        return ExtType(code, data)
+
+
+    try:
+        _native_types = (bool, int, long, float, bytes, unicode, bytearray, dict, list, tuple)
+    except NameError:
+        # python 3
+        _native_types = (bool, int, float, bytes, str, bytearray, dict, list, tuple)
+
+
+    class ContainerEncoder(object):
+        '''Wraps a default function, serialising tuples, and sets if sets
+        is True, as extension types which hold their items as a msgpack array.
+        kwargs are the Packer arguments, and are read on first use, so
+        they include this encoder's default.
+
+        Tuples are only passed to default with strict_types, which also
+        passes subclasses of the natively packed types (ie, numpy floats
+        and namedtuples). These are packed as their base type, as they
+        are without strict_types.
+        Encoders are not thread safe.
+        '''
+        def __init__(self, default, kwargs, sets=False):
+            self._default = default
+            self.kwargs = kwargs
+            self.sets = sets
+            self.strict = kwargs.get('strict_types', False)
+            # a Packer for each level of nested containers
+            self.packers = []
+            self.depth = 0
+
+        def _pack(self, items):
+            depth = self.depth
+            if depth == len(self.packers):
+                self.packers.append(serialiser.Packer(**self.kwargs))
+            self.depth = depth + 1
+            try:
+                return self.packers[depth].pack(items)
+            finally:
+                self.depth = depth
+
+        def default(self, obj):
+            t = type(obj)
+            if t is set and self.sets:
+                return tuple.__new__(ExtType, (EXT_SET, self._pack(list(obj))))
+            if t is tuple:
+                return tuple.__new__(ExtType, (EXT_TUPLE, self._pack(list(obj))))
+            if self.strict and isinstance(obj, _native_types):
+                for native in _native_types:
+                    if isinstance(obj, native):
+                        return list(obj) if native is tuple else native(obj)
+            return self._default(obj)
+
+
+    # Unpacker arguments which unpackb does not accept
+    _stream_arguments = ('file_like', 'read_size', 'max_buffer_size')
+
+
+    class ContainerDecoder(object):
+        '''Wraps an ext_hook, deserialising the sets and tuples of a
+        ContainerEncoder.
+        kwargs are the unpack arguments, and are read on first use, so
+        they include this decoder's ext_hook.
+        '''
+        def __init__(self, ext_hook, kwargs):
+            self._ext_hook = ext_hook
+            self._kwargs = kwargs
+            self.kwargs = None
+
+        def _unpack(self, data):
+            kwargs = self.kwargs
+            if kwargs is None:
+                kwargs = self.kwargs = dict(
+                    (k, v) for k, v in self._kwargs.items()
+                    if k not in _stream_arguments
+                )
+            return serialiser.unpackb(data, **kwargs)
+
+        def ext_hook(self, code, data):
+            if code == EXT_TUPLE:
+                return tuple(self._unpack(data))
+            if code == EXT_SET:
+                return set(self._unpack(data))
+            return self._ext_hook(code, data)
+
+
+    def _container_options(kwargs):
+        '''Sets strict_types if tuples are stored as extension types, and
+        returns True if sets are.
+        tuples is 'array' to store tuples as arrays, which are loaded as
+        lists, or as tuples with use_list=False. This is the fastest.
+        tuples is 'ext' to store tuples as extension types, which are
+        always loaded as tuples.
+        sets is 'dict' to store sets as tagged dicts, which is the fastest,
+        or 'ext' to store them as extension types, which are smaller.
+        '''
+        tuples = kwargs.pop('tuples', 'array')
+        if tuples == 'ext':
+            kwargs['strict_types'] = True
+        elif tuples != 'array':
+            raise ValueError('Unknown tuples option {}'.format(tuples))
+        sets = kwargs.pop('sets', 'dict')
+        if sets not in ('dict', 'ext'):
+            raise ValueError('Unknown sets option {}'.format(sets))
+        return sets == 'ext'
+
+
+    def _container_encoder(kwargs):
+        '''Wraps the default function with a ContainerEncoder.
+        '''
+        sets = _container_options(kwargs)
+        if sets or kwargs.get('strict_types'):
+            kwargs['default'] = ContainerEncoder(kwargs['default'], kwargs, sets).default
+
+
+    def _container_decoder(kwargs):
+        '''Wraps the ext_hook with a ContainerDecoder.
+        '''
+        kwargs['ext_hook'] = ContainerDecoder(kwargs['ext_hook'], kwargs).ext_hook
+
+
+    def _profile_encoder(kwargs):
+        '''Wraps the default function with the requested Profile, or the
+        Profile entered on this thread.
+        '''
+        profile = kwargs.pop('profile', None) or profiling.active()
+        if profile:
+            kwargs['default'] = profile.default(kwargs['default'])
+
+
+    def _decompression_decoder(kwargs):
+        '''Wraps the object_hook with a CompressionDecoder if decompress was requested.
+        decompress is True, or the maximum decompressed size of each value in bytes.
+        '''
+        max_size = kwargs.pop('decompress', None)
+        if not max_size:
+            return
+
+        from .serialisers import compression
+        kwargs['object_hook'] = compression.CompressionDecoder(
+            kwargs['object_hook'],
+            compression.MAX_DECOMPRESSED_SIZE if max_size is True else max_size,
+        ).from_dict
+
+
+    def _profile_decoder(kwargs):
+        '''Wraps the object_hook and ext_hook with the requested Profile,
+        or the Profile entered on this thread.
+        '''
+        profile = kwargs.pop('profile', None) or profiling.active()
+        if profile:
+            kwargs['object_hook'] = profile.object_hook(kwargs['object_hook'])
+            kwargs['ext_hook'] = profile.ext_hook(kwargs['ext_hook'])
+
+
+    def _lazy_decoder(kwargs):
+        '''Wraps the object_hook with a LazyDecoder if lazy was requested.
+        lazy is True for the default lazy types, or a list of serialised types.
+        '''
+        lazy = kwargs.pop('lazy', None)
+        if not lazy:
+            return
+
+        from .lazy import LazyDecoder, LAZY_TYPES
+        decoder = LazyDecoder(kwargs['object_hook'], LAZY_TYPES if lazy is True else lazy)
+        kwargs['object_hook'] = decoder.from_dict
+
+
+    def _reference_decoder(kwargs):
+        '''Wraps the object_hook with a ReferenceDecoder if refs was requested.
+        '''
+        if not kwargs.pop('refs', False):
+            return None
+
+        from .references import ReferenceDecoder
+        decoder = ReferenceDecoder(kwargs['object_hook'])
+        kwargs['object_hook'] = decoder.from_dict
+        return decoder
+
+
+    def _reference_encoder(kwargs):
+        '''Wraps the default function with a ReferenceEncoder if refs was requested.
+        '''
+        if not kwargs.pop('refs', False):
+            return
+
+        from .references import ReferenceEncoder
+        kwargs['default'] = ReferenceEncoder(kwargs['default']).default
+
+
+    def _compression_encoder(kwargs):
+        '''Wraps the default function with a CompressionEncoder if compress was requested.
+        compress is the codec name, or True for zlib.
+        '''
+        codec = kwargs.pop('compress', None)
+        threshold = kwargs.pop('compress_threshold', None)
+        if not codec:
+            return
+
+        from .serialisers import compression
+        kwargs['default'] = compression.CompressionEncoder(
+            kwargs['default'],
+            'zlib' if codec is True else codec,
+            threshold or compression.COMPRESS_THRESHOLD,
+            binary=True,
+        ).default
+
+
+    def _schema_decoder(kwargs):
+        '''Wraps the object_hook with a SchemaDecoder if compact was requested.
+        '''
+        if not kwargs.pop('compact', False):
+            return
+
+        from .schemas import SchemaDecoder
+        kwargs['object_hook'] = SchemaDecoder(kwargs['object_hook']).from_dict
+
+
+    def _schema_encoder(kwargs):
+        '''Wraps the default function with a SchemaEncoder if compact was requested.
+        '''
+        if not kwargs.pop('compact', False):
+            return None
+
+        from .schemas import SchemaEncoder
+        encoder = SchemaEncoder(kwargs['default'])
+        kwargs['default'] = encoder.default
+        return encoder
+
+
+    def _schema_header(encoder, data, kwargs):
+        '''Adds the schema table to the serialised document.
+        '''
+        packer = serialiser.Packer(**kwargs)
+        return b''.join([
+            packer.pack_map_header(3),
+            packer.pack('__type__'),
+            packer.pack('compact'),
+            packer.pack('schemas'),
+            packer.pack(encoder.schemas),
+            packer.pack('data'),
+            data,
+        ])
+
+
     def load(*args, **kwargs):
         kwargs['object_hook'] = from_dict
-        return serialiser.load(*args, **kwargs)
+        kwargs['ext_hook'] = ext_hook
+        _decompression_decoder(kwargs)
+        _profile_decoder(kwargs)
+        _lazy_decoder(kwargs)
+        _schema_decoder(kwargs)
+        decoder = _reference_decoder(kwargs)
+        _container_decoder(kwargs)
+        obj = serialiser.load(*args, **kwargs)
+        return decoder.resolve(obj) if decoder else obj
 
 
     def loads(*args, **kwargs):
         kwargs['object_hook'] = from_dict
-        return serialiser.loads(*args, **kwargs)
+        kwargs['ext_hook'] = ext_hook
+        _decompression_decoder(kwargs)
+        _profile_decoder(kwargs)
+        _lazy_decoder(kwargs)
+        _schema_decoder(kwargs)
+        decoder = _reference_decoder(kwargs)
+        _container_decoder(kwargs)
+        obj = serialiser.loads(*args, **kwargs)
+        return decoder.resolve(obj) if decoder else obj
+
+
+    def dump(obj, fp, *args, **kwargs):
+        fp.write(dumps(obj, *args, **kwargs))
+
+
+    def dumps(obj, *args, **kwargs):
+        workers = kwargs.pop('workers', None)
+        pool = kwargs.pop('pool', 'auto')
+        if workers:
+            # see jaweson.parallel
+            from . import parallel
+            return parallel.dumps(obj, *args, format='msgpack', workers=workers, pool=pool, **kwargs)
+
+        kwargs['default'] = default
+        _profile_encoder(kwargs)
+        _compression_encoder(kwargs)
+        encoder = _schema_encoder(kwargs)
+        _reference_encoder(kwargs)
+        _container_encoder(kwargs)
+        data = serialiser.dumps(obj, *args, **kwargs)
+        if encoder:
+            # the schema table is only complete once the document is serialised
+            return _schema_header(encoder, data, kwargs)
+        return data
+
+
+    def dumps_batch(objs, **kwargs):
+        '''Serialises a list of Serialisable objects of a single class
+        as columns of field values. See jaweson.serialisers.columns.
+        '''
+        return dumps(to_columns(objs), **kwargs)
+
 
+    def loads_batch(s, columns=False, **kwargs):
+        '''Deserialises a batch serialised with dumps_batch.
+        If columns is True, a dict of field -> column is returned
+        instead of the list of objects.
+        '''
+        if not columns:
+            return loads(s, **kwargs)
+        kwargs['object_hook'] = make_from_dict({'columns': column_dict})
+        kwargs['ext_hook'] = ext_hook
+        _profile_decoder(kwargs)
+        _container_decoder(kwargs)
+        return serialiser.loads(s, **kwargs)
 
-    def dump(*args, **kwargs):
-        kwargs['default'] = to_dict
-        return serialiser.dump(*args, **kwargs)
 
+    class Encoder(object):
+        '''Serialises objects with a fixed Registry and Packer arguments.
+        registry defaults to a snapshot of the registered serialisers.
+        kwargs are passed to msgpack.Packer, ie, use_bin_type.
+        tuples is 'ext' or 'array', and sets 'ext' or 'dict', see dumps.
+        refs and compact are only supported by dump and dumps.
+        profile is a Profile which records every object serialised.
+        Encoders are safe to share between threads, each thread
+        re-uses its own Packer.
+        '''
+        def __init__(self, registry=None, profile=None, **kwargs):
+            self.registry = registry or Registry()
+            kwargs['default'] = profile.default(self.default) if profile else self.default
+            kwargs['autoreset'] = True
+            self.sets = _container_options(kwargs)
+            self.kwargs = kwargs
+            self._local = threading.local()
+
+        def default(self, obj):
+            s = self.registry.find_serialiser(obj)
+            if s:
+                ext = s.to_ext(obj)
+                if ext is not None:
+                    return tuple.__new__(ExtType, ext)
+                return s.to_binary(obj)
+            if type(obj) is Lazy:
+                return _serialise_lazy(obj, self.default)
+
+            raise TypeError('Unable to serialise object of type {}'.format(type(obj)))
+
+        def packer(self):
+            '''Returns the calling thread's Packer.
+            '''
+            try:
+                return self._local.packer
+            except AttributeError:
+                kwargs = dict(self.kwargs)
+                if self.sets or kwargs.get('strict_types'):
+                    kwargs['default'] = ContainerEncoder(kwargs['default'], kwargs, self.sets).default
+                packer = self._local.packer = serialiser.Packer(**kwargs)
+                return packer
+
+        def dumps(self, obj):
+            return self.packer().pack(obj)
+
+        def dump(self, obj, fp):
+            fp.write(self.packer().pack(obj))
+
+
+    class Decoder(object):
+        '''Deserialises objects with a fixed Registry and unpack arguments.
+        See Encoder.
+        Messages are unpacked with unpackb, which holds no state between
+        calls, so a malformed message can't affect the next one.
+        '''
+        def __init__(self, registry=None, profile=None, **kwargs):
+            self.registry = registry or Registry()
+            kwargs['object_hook'] = self.registry.from_dict
+            kwargs['ext_hook'] = self.ext_hook
+            _decompression_decoder(kwargs)
+            if profile:
+                kwargs['object_hook'] = profile.object_hook(kwargs['object_hook'])
+                kwargs['ext_hook'] = profile.ext_hook(kwargs['ext_hook'])
+            _container_decoder(kwargs)
+            self.kwargs = kwargs
+
+        def ext_hook(self, code, data):
+            f = self.registry.ext_deserialisers.get(code)
+            if f:
+                return f(data)
+            return ExtType(code, data)
+
+        def loads(self, data):
+            return serialiser.unpackb(data, **self.kwargs)
+
+        def load(self, fp):
+            return serialiser.unpackb(fp.read(), **self.kwargs)
+
+
+    class FeedDecoder(object):
+        '''Incrementally decodes msgpack as data is received, without
+        blocking on reads. For use with event loops and non-blocking sockets.
+
+        feed returns the deserialised values completed by each chunk of data.
+        close raises ValueError if the data ends part way through a value.
+        If array is True, the data holds a single top-level array and its
+        items are returned instead.
+        kwargs are passed to msgpack.Unpacker, ie, max_buffer_size.
+        '''
+        def __init__(self, array=False, **kwargs):
+            kwargs['object_hook'] = from_dict
+            kwargs['ext_hook'] = ext_hook
+            _decompression_decoder(kwargs)
+            _profile_decoder(kwargs)
+            _lazy_decoder(kwargs)
+            _container_decoder(kwargs)
+            self.unpacker = serialiser.Unpacker(**kwargs)
+            self.array = array
+            # items remaining in the array, None until its header is read
+            self.remaining = None
+            self.size = 0
+
+        def feed(self, data):
+            self.unpacker.feed(data)
+            self.size += len(data)
+            if not self.array:
+                return list(self.unpacker)
+
+            values = []
+            try:
+                if self.remaining is None:
+                    self.remaining = self.unpacker.read_array_header()
+                while self.remaining:
+                    values.append(self.unpacker.unpack())
+                    self.remaining -= 1
+            except serialiser.OutOfData:
+                pass
+            return values
+
+        def close(self):
+            if self.array and self.remaining:
+                raise ValueError('Unterminated msgpack array')
+            if self.unpacker.tell() != self.size:
+                raise ValueError('Unterminated msgpack value')
+            return []
+
+
+    def iterload(fp, array=False, **kwargs):
+        '''Incrementally decodes a stream of concatenated msgpack values,
+        yielding deserialised values one at a time.
+        If array is True, the stream holds a single top-level array and its
+        items are yielded instead.
+        kwargs are passed to msgpack.Unpacker, ie, read_size and max_buffer_size.
+        '''
+        kwargs['object_hook'] = from_dict
+        kwargs['ext_hook'] = ext_hook
+        _decompression_decoder(kwargs)
+        _profile_decoder(kwargs)
+        _lazy_decoder(kwargs)
+        _container_decoder(kwargs)
+        unpacker = serialiser.Unpacker(fp, **kwargs)
+        if not array:
+            for obj in unpacker:
+                yield obj
+            return
 
-    def dumps(*args, **kwargs):
-        kwargs['default'] = to_dict
-        return serialiser.dumps(*args, **kwargs)
-except:
+        for _ in range(unpacker.read_array_header()):
+            yield unpacker.unpack()
+except ImportError:
+    # no msgpack support
     pass
@@ -0,0 +1,314 @@
+"""Provides parallel de|serialisation of large collections.
+
+The items of a top-level list or tuple, or the values of a top-level
+dict, are split into chunks which are serialised concurrently, and the
+serialised chunks are joined into the same output as the format's dumps.
+
+Streams of framed values (newline-delimited JSON, or concatenated
+MsgPack values) are split at frame boundaries and deserialised
+concurrently.
+
+By default ('auto') work is run in a thread pool where it releases the
+GIL, which is compression and the buffer copies of large numpy arrays
+and bytes packed by MsgPack, and in a process pool otherwise, as the
+serialisers hold the GIL for most of their work (ie, base64 encoding).
+Objects must be picklable to be sent to a process pool, and Serialisable
+classes must be importable by the worker processes. Thread pools avoid
+pickling and copying the values to another process, which is most of the
+cost of sending large arrays to a process pool (see
+benchmarks/parallel.py).
+
+Pools are created on first use and shared by later calls with the same
+kind of pool and number of workers, until close_pools is called or the
+interpreter exits. Callers can also pass their own pool.
+"""
+from __future__ import absolute_import
+from multiprocessing.pool import Pool, ThreadPool
+import atexit
+import sys
+import threading
+
+# chunks created for each worker, to balance uneven items
+CHUNKS_PER_WORKER = 4
+
+# buffers of at least this many bytes are copied without the GIL
+GIL_FREE_BYTES = 64 * 1024
+
+# items inspected by 'auto' to choose a pool
+AUTO_SAMPLES = 16
+
+_pools = {
+    'process': Pool,
+    'thread': ThreadPool,
+}
+
+# (kind, workers) -> the pool shared by calls which request it
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def _module(format):
+    if format == 'json':
+        from . import json
+        return json
+    if format == 'msgpack':
+        from . import msgpack
+        return msgpack
+    raise ValueError('Unknown format {}'.format(format))
+
+
+def _chunks(values, n):
+    '''Splits the list of values into at most n chunks of similar size.
+    '''
+    size = max(1, -(-len(values) // n))
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def _large_buffer(value):
+    '''Returns True if the value is a buffer copied without the GIL.
+    '''
+    if isinstance(value, (bytes, bytearray)):
+        return len(value) >= GIL_FREE_BYTES
+    # only arrays of an imported numpy can be present
+    np = sys.modules.get('numpy')
+    return (
+        np is not None
+        and isinstance(value, np.ndarray)
+        and not value.dtype.hasobject
+        and value.nbytes >= GIL_FREE_BYTES
+    )
+
+
+def _auto_pool(format, values, kwargs):
+    '''Returns 'thread' if most of the work of serialising the values
+    releases the GIL, and 'process' otherwise.
+    Compression releases the GIL, as do the buffer copies of MsgPack
+    when the values are large arrays or bytes. JSON's base64 encoding
+    holds the GIL.
+    '''
+    if kwargs.get('compress'):
+        return 'thread'
+    if format != 'msgpack' or not values:
+        return 'process'
+    step = max(1, len(values) // AUTO_SAMPLES)
+    samples = values[::step]
+    if all(_large_buffer(v) for v in samples):
+        return 'thread'
+    return 'process'
+
+
+def _shared_pool(kind, workers):
+    '''Returns the shared pool of the kind and number of workers,
+    creating it on first use.
+    '''
+    key = (kind, workers)
+    with _shared_lock:
+        pool = _shared.get(key)
+        if pool is None:
+            pool = _shared[key] = _pools[kind](workers)
+        return pool
+
+
+def close_pools():
+    '''Closes the shared pools, waiting for their workers to exit.
+    Later calls create new pools.
+    '''
+    with _shared_lock:
+        pools = list(_shared.values())
+        _shared.clear()
+    for pool in pools:
+        pool.close()
+        pool.join()
+
+
+atexit.register(close_pools)
+
+
+def _map(f, args, workers, pool):
+    '''Calls f for each item of args in a pool, returning the results in order.
+    pool is 'process' or 'thread' for a shared pool, or an existing pool
+    with a map method.
+    '''
+    if not hasattr(pool, 'map'):
+        pool = _shared_pool(pool, workers)
+    return pool.map(f, args)
+
+
+def _json_separators(kwargs):
+    return kwargs.get('separators') or (', ', ': ')
+
+
+def _encode_chunk(args):
+    '''Serialises a chunk of values, or (key, value) pairs if
+    pairs is True, as a fragment of an array or map.
+    '''
+    format, values, pairs, kwargs = args
+    module = _module(format)
+    if format == 'json':
+        item_separator, key_separator = _json_separators(kwargs)
+        if pairs:
+            return item_separator.join(
+                module.dumps(k, **kwargs) + key_separator + module.dumps(v, **kwargs)
+                for k, v in values
+            )
+        return item_separator.join(module.dumps(v, **kwargs) for v in values)
+
+    if pairs:
+        return b''.join(
+            module.dumps(k, **kwargs) + module.dumps(v, **kwargs)
+            for k, v in values
+        )
+    return b''.join(module.dumps(v, **kwargs) for v in values)
+
+
+def _decode_chunk(args):
+    '''Deserialises a chunk of frames.
+    '''
+    format, frames, kwargs = args
+    module = _module(format)
+    return [module.loads(frame, **kwargs) for frame in frames]
+
+
+def _splittable(format, obj, kwargs):
+    '''Returns True if the object can be split into chunks which are
+    serialised the same as the whole object.
+    '''
+    for k in ('refs', 'compact', 'blob_file', 'profile'):
+        if kwargs.get(k):
+            raise TypeError('{} is not supported by parallel serialisation'.format(k))
+
+    if format == 'json':
+        # nested indentation depends on the depth of each value
+        if kwargs.get('indent') is not None:
+            return False
+        if isinstance(obj, dict):
+            # other key types are converted to strings by the encoder
+            return all(isinstance(k, (str, type(u''))) for k in obj)
+    if type(obj) is tuple and kwargs.get('tuples') == 'ext':
+        # stored as an extension type rather than an array
+        return False
+    return isinstance(obj, (list, tuple, dict))
+
+
+def dumps(obj, format='json', workers=4, pool='auto', **kwargs):
+    '''Serialises the object, encoding the items of a top-level list
+    or tuple, or the values of a top-level dict in parallel.
+    The output is the same as the format's dumps with kwargs.
+    JSON is always serialised with the standard library.
+    pool is 'auto', 'process', 'thread', or an existing pool.
+    '''
+    module = _module(format)
+    if format == 'json':
+        kwargs['backend'] = 'json'
+    if not _splittable(format, obj, kwargs) or len(obj) < 2:
+        return module.dumps(obj, **kwargs)
+
+    pairs = isinstance(obj, dict)
+    if pairs:
+        values = list(obj.items())
+        if kwargs.get('sort_keys'):
+            values.sort(key=lambda kv: kv[0])
+    else:
+        values = list(obj)
+
+    if pool == 'auto':
+        pool = _auto_pool(format, [v for _, v in values] if pairs else values, kwargs)
+    chunks = _chunks(values, workers * CHUNKS_PER_WORKER)
+    data = _map(
+        _encode_chunk,
+        [(format, chunk, pairs, kwargs) for chunk in chunks],
+        workers,
+        pool,
+    )
+
+    if format == 'json':
+        item_separator, _ = _json_separators(kwargs)
+        start, end = ('{', '}') if pairs else ('[', ']')
+        return start + item_separator.join(data) + end
+
+    from msgpack import Packer
+    # headers are packed the same with any arguments
+    packer = Packer()
+    if pairs:
+        header = packer.pack_map_header(len(values))
+    else:
+        header = packer.pack_array_header(len(values))
+    return header + b''.join(data)
+
+
+def _encode_frames(args):
+    '''Serialises each value of a chunk, returning the list of frames.
+    '''
+    format, values, kwargs = args
+    module = _module(format)
+    return [module.dumps(v, **kwargs) for v in values]
+
+
+def dumps_frames(objs, format='json', workers=4, pool='auto', **kwargs):
+    '''Serialises each object as a frame, in parallel.
+    JSON frames are newline-delimited, MsgPack frames are concatenated.
+    The result can be read with loads_frames or the format's iterload.
+    '''
+    if format == 'json':
+        kwargs['backend'] = 'json'
+        # frames must not contain newlines
+        kwargs.pop('indent', None)
+
+    objs = list(objs)
+    if pool == 'auto':
+        pool = _auto_pool(format, objs, kwargs)
+    chunks = _chunks(objs, workers * CHUNKS_PER_WORKER)
+    frames = _map(
+        _encode_frames,
+        [(format, chunk, kwargs) for chunk in chunks],
+        workers,
+        pool,
+    )
+    if format == 'json':
+        return ''.join(frame + '\n' for chunk in frames for frame in chunk)
+    return b''.join(frame for chunk in frames for frame in chunk)
+
+
+def _json_frames(data):
+    # only newlines delimit frames, other line breaks may occur in strings
+    return [line for line in data.split('\n') if line.strip()]
+
+
+def _msgpack_frames(data):
+    from msgpack import Unpacker
+    # the whole stream is fed at once
+    unpacker = Unpacker(max_buffer_size=max(len(data), 1))
+    unpacker.feed(data)
+    frames = []
+    start = 0
+    while start < len(data):
+        unpacker.skip()
+        end = unpacker.tell()
+        frames.append(data[start:end])
+        start = end
+    return frames
+
+
+def loads_frames(data, format='json', workers=4, pool='auto', **kwargs):
+    '''Deserialises a stream of frames in parallel, returning a list
+    of the deserialised values.
+    JSON frames are newline-delimited, MsgPack frames are concatenated.
+    Decoding holds the GIL, so 'auto' uses a process pool.
+    '''
+    if format == 'json':
+        frames = _json_frames(data)
+    elif format == 'msgpack':
+        frames = _msgpack_frames(data)
+    else:
+        raise ValueError('Unknown format {}'.format(format))
+
+    if pool == 'auto':
+        pool = 'process'
+    chunks = _chunks(frames, workers * CHUNKS_PER_WORKER)
+    values = _map(
+        _decode_chunk,
+        [(format, chunk, kwargs) for chunk in chunks],
+        workers,
+        pool,
+    )
+    return [v for chunk in values for v in chunk]
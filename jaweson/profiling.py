@@ -0,0 +1,170 @@
+"""Provides per-type profiling of de|serialisation.
+
+A Profile records the calls, time and serialised bytes of each type tag
+and Serialisable class. Pass it to dumps and loads, or to an Encoder or
+Decoder, to profile only those calls::
+
+    profile = Profile()
+    json.dumps(obj, profile=profile)
+    json.loads(j, profile=profile)
+    profile.stats()
+
+or use it as a context manager to profile every call to the module level
+functions on the current thread::
+
+    with Profile() as profile:
+        handle_request()
+    send_metrics(profile.stats())
+
+Types are recorded by their '__type__' tag, Serialisable objects by their
+'__class__', and msgpack extension types as 'ext:<code>'. bytes is the
+length of the serialised strings and binary data of each type (ie, the
+base64 data of an ndarray), excluding nested objects. Sets and tuples
+stored as msgpack extension types (sets='ext' or tuples='ext') are not
+recorded.
+
+Only the serialisers are timed, not the JSON or msgpack library itself.
+Profiling adds no cost to calls made without one.
+"""
+from __future__ import absolute_import
+import threading
+import timeit
+
+_timer = timeit.default_timer
+_local = threading.local()
+
+
+def active():
+    '''Returns the Profile entered on the current thread, or None.
+    '''
+    return getattr(_local, 'profile', None)
+
+
+def _name(data):
+    '''Returns the name a serialised object is recorded under.
+    '''
+    if isinstance(data, dict):
+        t = data.get('__type__')
+        if t == 'serialisable':
+            return data.get('__class__', t)
+        return t
+    if isinstance(data, tuple):
+        # msgpack ExtType
+        return 'ext:{}'.format(data[0])
+    # not a serialised object, ie, an iterator streamed by iterencode
+    return None
+
+
+def _size(data):
+    '''Returns the length of the strings and binary data of a serialised object.
+    '''
+    if not isinstance(data, dict):
+        # msgpack ExtType
+        return len(data[1])
+    size = 0
+    for v in data.values():
+        if isinstance(v, (bytes, type(u''), bytearray, memoryview)):
+            size += len(v)
+    return size
+
+
+class Profile(object):
+    '''Records the calls, time and bytes of each serialised type.
+    callback is called as callback(operation, name, seconds, bytes) for
+    every object, where operation is 'encode' or 'decode', ie, to forward
+    each measurement to a metrics system.
+    Profiles are safe to share between threads.
+    '''
+    def __init__(self, callback=None):
+        self.callback = callback
+        # (operation, name) -> [calls, seconds, bytes]
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        # the profiles entered on this thread, so a profile can be
+        # entered on several threads, or nested
+        try:
+            stack = _local.stack
+        except AttributeError:
+            stack = _local.stack = []
+        stack.append(active())
+        _local.profile = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.profile = _local.stack.pop()
+
+    def record(self, operation, name, seconds, size):
+        with self._lock:
+            try:
+                stats = self._stats[(operation, name)]
+            except KeyError:
+                stats = self._stats[(operation, name)] = [0, 0., 0]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] += size
+        if self.callback:
+            self.callback(operation, name, seconds, size)
+
+    def stats(self):
+        '''Returns the recorded stats as a dict of
+        {operation: {name: {'calls': int, 'seconds': float, 'bytes': int}}}.
+        '''
+        result = {'encode': {}, 'decode': {}}
+        with self._lock:
+            for (operation, name), (calls, seconds, size) in self._stats.items():
+                result[operation][name] = {
+                    'calls': calls,
+                    'seconds': seconds,
+                    'bytes': size,
+                }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def default(self, default):
+        '''Wraps a default function (ie, to_dict), recording each object it serialises.
+        '''
+        record = self.record
+
+        def profiled(obj):
+            start = _timer()
+            data = default(obj)
+            seconds = _timer() - start
+            name = _name(data)
+            if name is not None:
+                record('encode', name, seconds, _size(data))
+            return data
+        return profiled
+
+    def object_hook(self, object_hook):
+        '''Wraps an object_hook (ie, from_dict), recording each tagged object it deserialises.
+        '''
+        record = self.record
+
+        def profiled(jobj):
+            if '__type__' not in jobj:
+                return object_hook(jobj)
+            # deserialisers may consume the serialised object
+            name = _name(jobj)
+            size = _size(jobj)
+            start = _timer()
+            obj = object_hook(jobj)
+            record('decode', name, _timer() - start, size)
+            return obj
+        return profiled
+
+    def ext_hook(self, ext_hook):
+        '''Wraps a msgpack ext_hook, recording each extension type it deserialises.
+        '''
+        record = self.record
+
+        def profiled(code, data):
+            start = _timer()
+            obj = ext_hook(code, data)
+            record('decode', 'ext:{}'.format(code), _timer() - start, len(data))
+            return obj
+        return profiled
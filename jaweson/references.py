@@ -0,0 +1,128 @@
+"""Provides shared reference and cycle aware de|serialisation.
+
+The first occurrence of an object is serialised with an additional
+'__id__' field. Later occurrences of the same object are replaced by::
+
+    {
+        '__type__': 'ref',
+        'id': <id>,
+    }
+
+And are deserialised as the same object.
+
+Only objects handled by a serialiser are tracked, native dicts and lists
+are not, so '__id__' is only read from tagged dicts (those with a
+'__type__'). References to ids which are not in the document raise
+ValueError.
+"""
+from __future__ import absolute_import
+from .serialisable import Serialisable, _field_plan
+
+
+class _Reference(object):
+    '''A placeholder for an object which has not been deserialised yet.
+    This occurs when an object references one of its parents.
+    '''
+    __slots__ = ('id',)
+
+    def __init__(self, id):
+        self.id = id
+
+
+class ReferenceEncoder(object):
+    '''Wraps a serialiser default function, replacing repeated
+    objects with references.
+    '''
+    def __init__(self, default):
+        self._default = default
+        self.ids = {}
+        # keep serialised objects alive so their ids are not re-used
+        self.objects = []
+
+    def default(self, obj):
+        key = id(obj)
+        n = self.ids.get(key)
+        if n is not None:
+            return {
+                '__type__': 'ref',
+                'id': n,
+            }
+
+        # register before serialising so cycles become references
+        n = self.ids[key] = len(self.objects)
+        self.objects.append(obj)
+        data = self._default(obj)
+        if isinstance(data, dict):
+            data['__id__'] = n
+        else:
+            # extension types can't carry an id
+            del self.ids[key]
+        return data
+
+
+class ReferenceDecoder(object):
+    '''Wraps a from_dict function, restoring references to the
+    same object.
+    Call resolve on the deserialised result to replace references which
+    could not be resolved during deserialisation (cycles).
+    '''
+    def __init__(self, from_dict):
+        self._from_dict = from_dict
+        self.objects = {}
+        self.unresolved = False
+
+    def from_dict(self, jobj):
+        if jobj.get('__type__') == 'ref':
+            n = jobj['id']
+            try:
+                return self.objects[n]
+            except KeyError:
+                self.unresolved = True
+                return _Reference(n)
+
+        # ids are only added to serialised objects, not native dicts
+        n = jobj.pop('__id__', None) if '__type__' in jobj else None
+        obj = self._from_dict(jobj)
+        if n is not None:
+            self.objects[n] = obj
+        return obj
+
+    def resolve(self, obj):
+        if not self.unresolved:
+            return obj
+        return self._resolve(obj, set())
+
+    def _resolve(self, obj, seen):
+        if isinstance(obj, _Reference):
+            try:
+                return self.objects[obj.id]
+            except KeyError:
+                raise ValueError('Reference to unknown object id {!r}'.format(obj.id))
+
+        if id(obj) in seen:
+            return obj
+        seen.add(id(obj))
+
+        if isinstance(obj, dict):
+            for k, v in obj.items():
+                obj[k] = self._resolve(v, seen)
+        elif isinstance(obj, list):
+            for i, v in enumerate(obj):
+                obj[i] = self._resolve(v, seen)
+        elif isinstance(obj, set):
+            values = [self._resolve(v, seen) for v in obj]
+            obj.clear()
+            obj.update(values)
+        elif type(obj) is tuple:
+            return tuple(self._resolve(v, seen) for v in obj)
+        elif isinstance(obj, Serialisable):
+            attrs = getattr(obj, '__dict__', None) or {}
+            for k, v in attrs.items():
+                attrs[k] = self._resolve(v, seen)
+            for k, descriptor in _field_plan(obj.__class__).slot_fields:
+                try:
+                    v = descriptor.__get__(obj, obj.__class__)
+                except AttributeError:
+                    continue
+                descriptor.__set__(obj, self._resolve(v, seen))
+        return obj
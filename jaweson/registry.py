@@ -0,0 +1,93 @@
+"""Provides isolated snapshots of the registered serialisers.
+
+The module level functions of jaweson.json and jaweson.msgpack use the
+global registries, which change as serialisers and Serialisable classes
+are defined. A Registry copies them once, so Encoder and Decoder objects
+have a fixed dispatch table, and services in the same process can
+restrict which serialisers and classes they accept.
+"""
+from __future__ import absolute_import
+from . import serialiser
+from .serialiser import Serialiser
+from .serialisable import serialised_name, _types
+from .lazy import Lazy, serialise as _serialise_lazy
+
+
+class Registry(object):
+    '''A fixed set of serialisers and Serialisable classes.
+
+    serialisers is a list of Serialiser classes or instances, in priority
+    order, and defaults to every registered serialiser, including those
+    which are otherwise imported on first use.
+    types is a list of the Serialisable classes which can be deserialised,
+    and defaults to every class defined so far.
+
+    Registries are not affected by later registrations and are
+    safe to share between threads.
+    '''
+    def __init__(self, serialisers=None, types=None):
+        if types is None:
+            self.types = dict(_types)
+        else:
+            self.types = dict((serialised_name(cls), cls) for cls in types)
+
+        if serialisers is None:
+            serialiser.load_lazy()
+            serialisers = serialiser.serialisers()
+        self.serialisers = []
+        for s in serialisers:
+            if not isinstance(s, Serialiser):
+                s = s()
+            # serialisers which resolve Serialisable classes are
+            # copied with this registry's classes
+            if hasattr(s, 'with_types'):
+                s = s.with_types(self.types)
+            self.serialisers.append(s)
+
+        self.python_types = {}
+        self.deserialisers = {}
+        self.ext_deserialisers = {}
+        for s in self.serialisers:
+            for t in s.python_types:
+                self.python_types[t] = s
+            self.deserialisers.update(s.deserialisers())
+            self.ext_deserialisers.update(s.ext_deserialisers())
+
+        # memoised type(obj) -> serialiser lookups
+        # concurrent lookups store the same value, so no lock is needed
+        self._cache = {}
+
+    def find_serialiser(self, obj):
+        t = type(obj)
+        try:
+            return self._cache[t]
+        except KeyError:
+            s = self._cache[t] = serialiser._resolve(t, self.python_types, self.serialisers)
+            return s
+
+    def to_dict(self, obj):
+        s = self.find_serialiser(obj)
+        if s:
+            return s.to_dict(obj)
+        if type(obj) is Lazy:
+            return _serialise_lazy(obj, self.to_dict)
+
+        raise TypeError('Unable to serialise object of type {}'.format(type(obj)))
+
+    def to_binary(self, obj):
+        s = self.find_serialiser(obj)
+        if s:
+            return s.to_binary(obj)
+        if type(obj) is Lazy:
+            return _serialise_lazy(obj, self.to_binary)
+
+        raise TypeError('Unable to serialise object of type {}'.format(type(obj)))
+
+    def from_dict(self, jobj):
+        if '__type__' in jobj:
+            try:
+                f = self.deserialisers[jobj['__type__']]
+            except (KeyError, TypeError):
+                return jobj
+            return f(jobj)
+        return jobj
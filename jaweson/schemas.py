@@ -0,0 +1,114 @@
+"""Provides a compact encoding for repetitive Serialisable payloads.
+
+Each distinct Serialisable class and field set, and each other serialised
+type and field set (ie, sets and tuples), is stored once in a header table
+of schemas::
+
+    {
+        '__type__': 'compact',
+        'schemas': [
+            {
+                '__type__': 'schema',
+                'class': '<class name>',
+                'fields': [<field names>],
+            },
+            {
+                '__type__': 'schema',
+                'type': '<serialised type>',
+                'fields': [<field names>],
+            },
+        ],
+        'data': <document>,
+    }
+
+Values in the document store the index of their schema and their
+field values in schema order::
+
+    {
+        '__type__': <schema index>,
+        'data': [<values>],
+    }
+
+The schema table must precede the document, so formats write the
+header explicitly after the document has been serialised.
+"""
+from __future__ import absolute_import
+
+try:
+    _string_types = (str, unicode)
+except NameError:
+    # python 3
+    _string_types = (str,)
+
+# Serialisable keys which are stored in the schema rather than as field values
+_serialisable_keys = ('__type__', '__class__')
+
+
+class SchemaEncoder(object):
+    '''Wraps a serialiser default function, replacing serialised
+    dicts with a schema index and positional values.
+    '''
+    def __init__(self, default):
+        self._default = default
+        # (type, class name, fields) -> index
+        self.ids = {}
+        self.schemas = []
+
+    def default(self, obj):
+        data = self._default(obj)
+        if not isinstance(data, dict):
+            return data
+        t = data.get('__type__')
+        if not isinstance(t, _string_types):
+            return data
+
+        if t == 'serialisable':
+            clsname = data['__class__']
+            fields = tuple(sorted(k for k in data if k not in _serialisable_keys))
+        else:
+            clsname = None
+            fields = tuple(sorted(k for k in data if k != '__type__'))
+        key = (t, clsname, fields)
+        n = self.ids.get(key)
+        if n is None:
+            n = self.ids[key] = len(self.schemas)
+            if clsname is not None:
+                schema = {'__type__': 'schema', 'class': clsname}
+            else:
+                schema = {'__type__': 'schema', 'type': t}
+            schema['fields'] = list(fields)
+            self.schemas.append(schema)
+        return {
+            '__type__': n,
+            'data': [data[k] for k in fields],
+        }
+
+
+class SchemaDecoder(object):
+    '''Wraps a from_dict function, restoring serialised dicts
+    from their schema.
+    '''
+    def __init__(self, from_dict):
+        self._from_dict = from_dict
+        # [(type, class name, fields)]
+        self.schemas = []
+
+    def from_dict(self, jobj):
+        t = jobj.get('__type__')
+        if type(t) is int:
+            t, clsname, fields = self.schemas[t]
+            data = dict(zip(fields, jobj['data']))
+            data['__type__'] = t
+            if clsname is not None:
+                data['__class__'] = clsname
+            return self._from_dict(data)
+        if t == 'schema':
+            if 'class' in jobj:
+                schema = ('serialisable', jobj['class'], jobj['fields'])
+            else:
+                schema = (jobj['type'], None, jobj['fields'])
+            self.schemas.append(schema)
+            return jobj
+        if t == 'compact':
+            return jobj['data']
+        return self._from_dict(jobj)
@@ -1,18 +1,65 @@
 from __future__ import absolute_import
 from .serialiser import Serialiser
+from .specialise import make_encoder, make_decoder
+import copy
+import types
+import weakref
+
+try:
+    import dataclasses
+except ImportError:
+    dataclasses = None
 
 
 _types = {}
 
+# field plans, keyed by class
+# cleared whenever an attribute of a Serialisable class is changed
+_plans = {}
+
+# SerialisableSerialisers, each of which keeps the specialised encode and
+# decode functions of its registry, keyed by class
+# these are cleared along with the field plans
+_function_caches = weakref.WeakSet()
+
+# field plan modes
+_SKIP = 0
+_CHECK = 1
+_ALWAYS = 2
+
+_member_descriptor = types.MemberDescriptorType
+
 
 def register_class(obj, clsname=None):
     global _types
     name = clsname or obj.__name__
+    existing = _types.get(name)
+    if existing is not None and _rebuilt_attrs_class(existing, obj):
+        # attrs replaces slotted classes with a rebuilt copy
+        _types[name] = obj
+        return
     if name in _types:
         raise TypeError('A class with the name "{}" is already defined'.format(name))
     _types[name] = obj
 
 
+def _rebuilt_attrs_class(old, new):
+    '''Returns True if new is the class attrs built from old for slots=True.
+    '''
+    return (
+        '__attrs_attrs__' in new.__dict__
+        and '__attrs_attrs__' not in old.__dict__
+        and old.__module__ == new.__module__
+        and old.__bases__ == new.__bases__
+    )
+
+
+def serialised_name(cls):
+    '''Returns the name a Serialisable class is serialised as.
+    '''
+    return getattr(cls, '_{}__classname'.format(cls.__name__), None) or cls.__name__
+
+
 class SerialisableMetaClass(type):
     def __new__(cls, clsname, bases, attrs):
         '''Automatically registers Serialisable subclasses at class definition time.
@@ -22,10 +69,236 @@ class SerialisableMetaClass(type):
         register_class(newclass, serialised_cls)
         return newclass
 
+    def __setattr__(cls, key, value):
+        super(SerialisableMetaClass, cls).__setattr__(key, value)
+        _clear_plans()
+
+    def __delattr__(cls, key):
+        super(SerialisableMetaClass, cls).__delattr__(key)
+        _clear_plans()
+
+
+def _clear_plans():
+    _plans.clear()
+    for s in list(_function_caches):
+        s.encoders.clear()
+        s.decoders.clear()
+
+
+def _field_mode(cls, key):
+    '''Class level equivalent of Serialisable.serialisable.
+    Returns _SKIP for names that are never serialised, _ALWAYS for
+    whitelisted names, and _CHECK for names which are serialised
+    if their value is not callable.
+    '''
+    if key.startswith('_Serialisable'):
+        return _SKIP
+    if key in cls._Serialisable__whitelist:
+        return _ALWAYS
+    if '__' in key:
+        return _SKIP
+    if key in cls._Serialisable__blacklist:
+        return _SKIP
+    if isinstance(getattr(cls, key, None), property):
+        return _SKIP
+    return _CHECK
+
+
+def _class_attr(cls, key):
+    '''Returns the raw class attribute, without invoking descriptors.
+    '''
+    for c in cls.__mro__:
+        if key in c.__dict__:
+            return c.__dict__[key]
+    return None
+
+
+def _init_fields(cls):
+    '''Returns (field name, __init__ argument) pairs for the fields
+    dataclasses or attrs pass to __init__, or None for other classes.
+    '''
+    if dataclasses is not None and dataclasses.is_dataclass(cls):
+        return tuple(
+            (f.name, f.name)
+            for f in dataclasses.fields(cls)
+            if f.init
+        )
+    fields = getattr(cls, '__attrs_attrs__', None)
+    if fields is not None:
+        # attrs strips leading underscores from private argument names
+        return tuple(
+            (f.name, getattr(f, 'alias', None) or f.name.lstrip('_'))
+            for f in fields
+            if f.init
+        )
+    return None
+
+
+class _FieldPlan(object):
+    '''The de|serialisation plan for a Serialisable class.
+
+    modes is a memo of attribute name -> field mode.
+    class_fields are class level attributes which are serialised when
+    not set on the instance.
+    slot_fields are (name, descriptor) pairs for __slots__ members.
+    descriptors are the data descriptors (slots, properties) which must
+    be set through the descriptor when deserialising.
+    init_fields are the (field name, argument) pairs dataclasses and
+    attrs classes are constructed with, or None.
+    '''
+    __slots__ = (
+        'modes', 'class_fields', 'slot_fields',
+        'descriptors', 'blacklist', 'skip', 'bulk', 'has_dict',
+        'init_fields', 'init_skip',
+    )
+
+    def __init__(self, cls):
+        self.modes = {}
+        class_fields = []
+        slot_fields = []
+        descriptors = {}
+        for k in dir(cls):
+            attr = _class_attr(cls, k)
+            if hasattr(type(attr), '__set__'):
+                descriptors[k] = attr
+
+            mode = self.modes[k] = _field_mode(cls, k)
+            if mode == _SKIP:
+                continue
+            if isinstance(attr, _member_descriptor):
+                slot_fields.append((k, attr))
+                continue
+            if mode == _CHECK and callable(getattr(cls, k)):
+                continue
+            class_fields.append(k)
+
+        self.class_fields = tuple(class_fields)
+        self.slot_fields = tuple(slot_fields)
+
+        self.blacklist = set(['__class__', '__type__'] + cls._Serialisable__blacklist)
+        self.skip = self.blacklist | set(descriptors)
+        self.has_dict = '__dict__' in descriptors
+        self.descriptors = tuple(
+            (k, v)
+            for k, v in descriptors.items()
+            if k not in self.blacklist
+        )
+
+        # values can be written directly to the instance __dict__ unless the
+        # class intercepts attribute assignment
+        self.bulk = cls.__setattr__ is object.__setattr__
+
+        self.init_fields = _init_fields(cls)
+        if self.init_fields is not None:
+            self.init_skip = self.blacklist | set(k for k, _ in self.init_fields)
+        else:
+            self.init_skip = None
+
+
+def _field_plan(cls):
+    '''Returns the _FieldPlan for a class.
+    '''
+    try:
+        return _plans[cls]
+    except KeyError:
+        plan = _plans[cls] = _FieldPlan(cls)
+        return plan
+
+
+def _serialise(obj):
+    '''Serialises the object through its to_dict method.
+    '''
+    data = obj.to_dict(obj)
+    data.update({
+        '__type__': 'serialisable',
+        '__class__': serialised_name(obj.__class__),
+    })
+    return data
+
+
+def _encoder(cls, obj):
+    '''Returns an encode function for the class,
+    specialised for the fields of obj.
+    Classes with custom to_dict or serialisable methods are
+    serialised through them.
+    '''
+    if (
+        cls.to_dict.__func__ is not Serialisable.to_dict.__func__
+        or cls.serialisable.__func__ is not Serialisable.serialisable.__func__
+    ):
+        return _serialise
+
+    plan = _field_plan(cls)
+    attrs = getattr(obj, '__dict__', None)
+    attr_keys = None
+    fields = []
+    callable_fields = set(
+        k for k, _ in plan.slot_fields
+        if plan.modes[k] == _CHECK
+    )
+    if attrs is not None:
+        attr_keys = list(attrs)
+        for k in attr_keys:
+            mode = plan.modes.get(k)
+            if mode is None:
+                mode = plan.modes[k] = _field_mode(cls, k)
+            if mode == _SKIP:
+                continue
+            fields.append(k)
+            if mode == _CHECK:
+                callable_fields.add(k)
+
+    return make_encoder(
+        serialised_name(cls),
+        attr_keys,
+        fields,
+        callable_fields,
+        [k for k in plan.class_fields if k not in (attrs or {})],
+        plan.slot_fields,
+        _serialise,
+    )
+
+
+def _decoder(cls, jobj):
+    '''Returns a decode function for the class,
+    specialised for the keys of jobj.
+    Classes with a custom from_dict method, or which require attributes
+    to be set with setattr are deserialised through from_dict.
+    '''
+    if cls.from_dict.__func__ is not Serialisable.from_dict.__func__:
+        return cls.from_dict
+
+    plan = _field_plan(cls)
+    if not plan.bulk or plan.init_fields is not None:
+        return cls.from_dict
+
+    keys = list(jobj)
+    descriptors = dict(plan.descriptors)
+    fields = []
+    slot_fields = []
+    for k in keys:
+        if k in plan.blacklist:
+            continue
+        if k in descriptors:
+            if not isinstance(descriptors[k], _member_descriptor):
+                # properties and other descriptors
+                return cls.from_dict
+            slot_fields.append((k, descriptors[k]))
+        else:
+            fields.append(k)
+
+    if fields and not plan.has_dict:
+        return cls.from_dict
+
+    return make_decoder(cls, keys, fields, slot_fields, cls.from_dict)
+
 
 class Serialisable(object):
     __metaclass__ = SerialisableMetaClass
 
+    # allow subclasses to declare __slots__ without an instance __dict__
+    __slots__ = ()
+
     __classname = None
 
     # stores a list of class attributes which should not be serialised
@@ -65,11 +338,37 @@ class Serialisable(object):
         that isn't prefixed with __, isn't in the blacklist, and isn't
         callable.
         '''
-        return {
-            k: getattr(obj, k)
-            for k in dir(obj)
-            if cls.serialisable(k, obj)
-        }
+        if cls.serialisable.__func__ is not Serialisable.serialisable.__func__:
+            # a custom serialisable method must be called for every attribute
+            return {
+                k: getattr(obj, k)
+                for k in dir(obj)
+                if cls.serialisable(k, obj)
+            }
+
+        objcls = obj.__class__
+        plan = _field_plan(objcls)
+        modes = plan.modes
+        attrs = getattr(obj, '__dict__', None) or {}
+        data = {}
+        for k, v in attrs.items():
+            mode = modes.get(k)
+            if mode is None:
+                mode = modes[k] = _field_mode(objcls, k)
+            if mode == _ALWAYS or (mode == _CHECK and not callable(v)):
+                data[k] = v
+        for k, descriptor in plan.slot_fields:
+            try:
+                v = descriptor.__get__(obj, objcls)
+            except AttributeError:
+                # unset slot
+                continue
+            if modes[k] == _ALWAYS or not callable(v):
+                data[k] = v
+        for k in plan.class_fields:
+            if k not in attrs:
+                data[k] = getattr(obj, k)
+        return data
         #raise NotImplementedError('No to_dict for {}'.format(cls.__class__.__name__))
 
     @classmethod
@@ -80,45 +379,104 @@ class Serialisable(object):
         Can be trivially over-written.
         '''
         try:
+            plan = _field_plan(cls)
+            if plan.init_fields is not None:
+                # dataclasses and attrs classes are constructed through their
+                # __init__, so validators run and frozen classes are supported
+                obj = cls(**{
+                    arg: jobj[k]
+                    for k, arg in plan.init_fields
+                    if k in jobj
+                })
+                skip = plan.init_skip
+                for k, v in jobj.items():
+                    if k not in skip:
+                        object.__setattr__(obj, k, v)
+                return obj
+
             obj = cls.__new__(cls)
-            blacklist = set(['__class__', '__type__'] + cls.__blacklist)
-            for k in set(jobj.keys()) - blacklist:
-                setattr(obj, k, jobj[k])
+            attrs = getattr(obj, '__dict__', None)
+            if plan.bulk:
+                for k, descriptor in plan.descriptors:
+                    if k in jobj:
+                        descriptor.__set__(obj, jobj[k])
+                skip = plan.skip
+                values = [(k, v) for k, v in jobj.items() if k not in skip]
+                if attrs is not None:
+                    attrs.update(values)
+                else:
+                    # no instance __dict__, let setattr raise for unknown keys
+                    for k, v in values:
+                        setattr(obj, k, v)
+            else:
+                for k in set(jobj.keys()) - plan.blacklist:
+                    setattr(obj, k, jobj[k])
 
             return obj
         except Exception as e:
-            raise TypeError('Failed to deserialise {}: {} - args: {}'.format(cls.__name__, str(e), kwargs))
+            raise TypeError('Failed to deserialise {}: {} - args: {}'.format(cls.__name__, str(e), jobj))
 
 
 class SerialisableSerialiser(Serialiser):
     python_types = (Serialisable,)
     serialised_types = ('serialisable',)
 
+    def __init__(self):
+        # the classes which can be deserialised, by serialised name
+        self.types = _types
+        # specialised functions, keyed by class
+        self.encoders = {}
+        self.decoders = {}
+        _function_caches.add(self)
+
+    def with_types(self, types):
+        '''Returns a copy of the serialiser which only deserialises the
+        classes in types, a dict of serialised name -> class, and has its
+        own specialised functions.
+        '''
+        s = copy.copy(self)
+        s.types = types
+        s.encoders = {}
+        s.decoders = {}
+        _function_caches.add(s)
+        return s
+
     def to_dict(self, obj):
         if isinstance(obj, Serialisable):
             cls = obj.__class__
-            clsname = getattr(obj, '_{}__classname'.format(cls.__name__), None) or cls.__name__
-            data = obj.to_dict(obj)
-            data.update({
-                '__type__': 'serialisable',
-                '__class__': clsname,
-            })
-            return data
+            try:
+                encoder = self.encoders[cls]
+            except KeyError:
+                encoder = self.encoders[cls] = _encoder(cls, obj)
+            return encoder(obj)
 
         return super(SerialisableSerialiser, self).to_dict(obj)
 
     def from_dict(self, jobj):
-        global _types
-
         if jobj.get('__type__') == 'serialisable':
-            cls_name = jobj['__class__']
-            if cls_name not in _types:
-                raise NotImplementedError('No type registered for {}'.format(cls_name))
+            return self.serialisable_from_dict(jobj)
 
-            cls = _types[cls_name]
-            if not hasattr(cls, 'from_dict'):
-                raise NotImplementedError('No from_dict classmethod for type {}'.format(cls_name))
+        return super(SerialisableSerialiser, self).from_dict(jobj)
 
-            return cls.from_dict(jobj)
+    def deserialisers(self):
+        return {
+            'serialisable': self.serialisable_from_dict,
+        }
 
-        return super(SerialisableSerialiser, self).from_dict(jobj)
+    def serialisable_from_dict(self, jobj):
+        '''Deserialises the object with the class registered for its
+        '__class__' in types, which defaults to every Serialisable class.
+        '''
+        cls_name = jobj['__class__']
+        types = self.types
+        if cls_name not in types:
+            raise NotImplementedError('No type registered for {}'.format(cls_name))
+
+        cls = types[cls_name]
+        try:
+            decoder = self.decoders[cls]
+        except KeyError:
+            if not hasattr(cls, 'from_dict'):
+                raise NotImplementedError('No from_dict classmethod for type {}'.format(cls_name))
+            decoder = self.decoders[cls] = _decoder(cls, jobj)
+        return decoder(jobj)
@@ -1,29 +1,286 @@
 from __future__ import absolute_import
+import importlib
+import threading
 
-_serialisers = set()
+# serialisers in registration order
+_serialisers = []
+
+# exact python type -> serialiser
+# later registrations take priority over earlier ones
+_python_types = {}
+
+# memoised type(obj) -> serialiser lookups
+# cleared whenever a serialiser is registered
+_cache = {}
+
+# serialised type tag -> serialiser
+_serialised_types = {}
+
+# serialised type tag -> callable(jobj)
+# built at registration time for from_dict
+_deserialisers = {}
+
+# binary extension type code -> callable(data)
+_ext_deserialisers = {}
+
+# serialisers which are imported on first use, see register_lazy
+# python type name ('module.name') -> module
+_lazy_python_types = {}
+# serialised type tag or extension type code -> module
+_lazy_serialised_types = {}
+
+# entry point groups of plugin serialisers, by the name of each entry point
+ENTRY_POINT_GROUPS = {
+    'jaweson.python_types': _lazy_python_types,
+    'jaweson.serialised_types': _lazy_serialised_types,
+}
+_entry_points_loaded = False
+
+_lazy_lock = threading.RLock()
+# loading is True while a lazy module is imported on the thread
+_lazy_local = threading.local()
 
 
 def register_serialiser(cls):
     global _serialisers
 
-    _serialisers.add(cls())
+    s = cls()
+    if getattr(_lazy_local, 'loading', False):
+        # serialisers loaded on first use are registered with the lowest
+        # priority, as they would have been when imported with jaweson,
+        # and don't replace serialisers registered since
+        _serialisers.insert(0, s)
+        for t in s.python_types:
+            _python_types.setdefault(t, s)
+        for t in s.serialised_types:
+            _serialised_types.setdefault(t, s)
+        for t, f in s.deserialisers().items():
+            _deserialisers.setdefault(t, f)
+        for code, f in s.ext_deserialisers().items():
+            _ext_deserialisers.setdefault(code, f)
+    else:
+        _serialisers.append(s)
+        for t in s.python_types:
+            _python_types[t] = s
+        for t in s.serialised_types:
+            _serialised_types[t] = s
+        _deserialisers.update(s.deserialisers())
+        _ext_deserialisers.update(s.ext_deserialisers())
+    _cache.clear()
+
+
+class _LazyDeserialiser(object):
+    '''Stands in for the deserialiser of a serialised type or extension
+    type code until its module is imported.
+    '''
+    def __init__(self, table, key, default):
+        self.table = table
+        self.key = key
+        self.default = default
+
+    def __call__(self, data):
+        _load(_lazy_serialised_types.get(self.key))
+        f = self.table.get(self.key)
+        if f is None or f is self:
+            return self.default(self.key, data)
+        return f(data)
+
+
+def _unknown_tag(t, jobj):
+    return jobj
+
+
+def _unknown_ext(code, data):
+    from msgpack import ExtType
+    return ExtType(code, data)
+
+
+def register_lazy(module, python_types=(), serialised_types=(), ext_types=()):
+    '''Registers a module which defines a serialiser, to be imported the
+    first time one of its types is de|serialised.
+    python_types are the names of the python types, ie, 'numpy.ndarray',
+    so the module's dependencies are not imported until they're needed.
+    serialised_types are the type tags, and ext_types the msgpack
+    extension type codes, the serialiser deserialises.
+    '''
+    with _lazy_lock:
+        for name in python_types:
+            _lazy_python_types[name] = module
+        for t in serialised_types:
+            _lazy_serialised_types[t] = module
+            _deserialisers.setdefault(t, _LazyDeserialiser(_deserialisers, t, _unknown_tag))
+        for code in ext_types:
+            _lazy_serialised_types[code] = module
+            _ext_deserialisers.setdefault(code, _LazyDeserialiser(_ext_deserialisers, code, _unknown_ext))
+        _cache.clear()
+
+
+def _load(module):
+    '''Imports a module registered with register_lazy.
+    Types it does not register once imported, ie, if its optional
+    dependency is not installed, are treated as unknown types.
+    '''
+    if module is None:
+        return
+
+    with _lazy_lock:
+        for table in (_lazy_python_types, _lazy_serialised_types):
+            for k, m in list(table.items()):
+                if m == module:
+                    del table[k]
+        for table in (_deserialisers, _ext_deserialisers):
+            for k, f in list(table.items()):
+                if isinstance(f, _LazyDeserialiser) and k not in _lazy_serialised_types:
+                    del table[k]
+
+        loading = getattr(_lazy_local, 'loading', False)
+        _lazy_local.loading = True
+        try:
+            importlib.import_module(module)
+        finally:
+            _lazy_local.loading = loading
+        _cache.clear()
+
+
+def _load_entry_points():
+    '''Registers the serialisers of installed plugins to be imported on first use.
+    Plugins declare the python type names and serialised types their module
+    provides as entry points, ie::
+
+        entry_points={
+            'jaweson.python_types': ['pandas.core.frame.DataFrame = mypackage.serialisers'],
+            'jaweson.serialised_types': ['dataframe = mypackage.serialisers'],
+        }
+
+    Entry points are only read the first time an unknown type is de|serialised.
+    '''
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    with _lazy_lock:
+        if _entry_points_loaded:
+            return
+        _entry_points_loaded = True
+        for group in ENTRY_POINT_GROUPS:
+            for name, module in _entry_points(group):
+                if group == 'jaweson.python_types':
+                    register_lazy(module, python_types=(name,))
+                else:
+                    register_lazy(module, serialised_types=(name,))
+
+
+def _entry_points(group):
+    '''Returns a list of (name, module) for the group's entry points.
+    '''
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        try:
+            import pkg_resources
+        except ImportError:
+            return []
+        return [(ep.name, ep.module_name) for ep in pkg_resources.iter_entry_points(group)]
+
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=group)
+    else:
+        eps = eps.get(group, [])
+    return [(ep.name, ep.value.split(':')[0].strip()) for ep in eps]
+
+
+def load_lazy():
+    '''Imports every serialiser registered with register_lazy
+    or declared by an entry point.
+    '''
+    _load_entry_points()
+    with _lazy_lock:
+        modules = set(_lazy_python_types.values()) | set(_lazy_serialised_types.values())
+        for module in modules:
+            _load(module)
+
+
+def _lazy_module(python_type):
+    '''Returns the lazily registered module for the python type or
+    one of its bases, or None.
+    Entry points are only read if no registered module matches.
+    '''
+    names = [
+        '{}.{}'.format(t.__module__, t.__name__)
+        for t in getattr(python_type, '__mro__', (python_type,))
+    ]
+    if not _entry_points_loaded and not any(name in _lazy_python_types for name in names):
+        _load_entry_points()
+    for name in names:
+        module = _lazy_python_types.get(name)
+        if module:
+            return module
+    return None
+
+
+def _unknown_serialised_type(jobj):
+    '''Called by from_dict for serialised types without a deserialiser.
+    Loads plugin serialisers the first time, returning jobj if the type
+    is still unknown.
+    '''
+    if _entry_points_loaded:
+        return jobj
+    _load_entry_points()
+    try:
+        f = _deserialisers[jobj['__type__']]
+    except (KeyError, TypeError):
+        return jobj
+    return f(jobj)
 
 
 def serialisers():
     return _serialisers
 
 
-def find_serialiser(python_type):
-    for s in _serialisers:
+def _resolve(python_type, python_types, serialisers):
+    '''Resolves a python type to a serialiser.
+    The type's MRO is walked from most to least specific, so
+    a serialiser for a subclass wins over one for its base.
+    Types that only match through isinstance (ie, abstract base classes)
+    fall back to a scan of the registered serialisers, newest first.
+    '''
+    for t in getattr(python_type, '__mro__', (python_type,)):
+        s = python_types.get(t)
+        if s:
+            return s
+
+    for s in reversed(serialisers):
         for t in s.python_types:
-            if isinstance(python_type, t):
+            if issubclass(python_type, t):
                 return s
+    return None
+
+
+def find_serialiser(python_type):
+    t = type(python_type)
+    try:
+        return _cache[t]
+    except KeyError:
+        s = _resolve(t, _python_types, _serialisers)
+        if s is None:
+            module = _lazy_module(t)
+            if module:
+                _load(module)
+                s = _resolve(t, _python_types, _serialisers)
+        _cache[t] = s
+        return s
 
 
 def find_deserialiser(serialised_type):
-    for s in _serialisers:
-        if serialised_type in s.serialised_types:
-            return s
+    s = _serialised_types.get(serialised_type)
+    if s is None:
+        if serialised_type not in _lazy_serialised_types:
+            _load_entry_points()
+        module = _lazy_serialised_types.get(serialised_type)
+        if module:
+            _load(module)
+            s = _serialised_types.get(serialised_type)
+    return s
 
 
 class SerialiserMetaClass(type):
@@ -44,5 +301,31 @@ class Serialiser(object):
     def to_dict(self, obj):
         raise ValueError('Unknown data type: {}'.format(type(obj)))
 
+    def to_binary(self, obj):
+        '''Serialises the object for formats with native binary support.
+        The returned dict may contain bytes or buffer (memoryview) values.
+        Defaults to to_dict.
+        '''
+        return self.to_dict(obj)
+
+    def to_ext(self, obj):
+        '''Serialises the object as an extension type for formats which
+        support them (msgpack).
+        Returns a tuple of (code, bytes), or None to use to_binary.
+        '''
+        return None
+
     def from_dict(self, jobj):
         raise ValueError('Unknown data type: {}'.format(jobj))
+
+    def deserialisers(self):
+        '''Returns a dict of serialised type -> callable(jobj).
+        Over-ride to provide a dedicated function for each serialised type,
+        avoiding the need to re-check the type in from_dict.
+        '''
+        return dict((t, self.from_dict) for t in self.serialised_types)
+
+    def ext_deserialisers(self):
+        '''Returns a dict of extension type code -> callable(data).
+        '''
+        return {}
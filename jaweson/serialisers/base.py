@@ -1,6 +1,21 @@
 from __future__ import absolute_import
+import struct
 from ..serialiser import Serialiser
 
+# msgpack extension type codes
+# set and tuple are stored by jaweson.msgpack, as their items are msgpack values
+EXT_COMPLEX = 4
+EXT_SET = 5
+EXT_TUPLE = 6
+
+# real and imaginary parts
+_complex = struct.Struct('<dd')
+
+
+def unpack_complex(data):
+    return complex(*_complex.unpack(data))
+
+
 class PythonTypeSerialiser(Serialiser):
     python_types = (set, tuple, complex)
     serialised_types = ('set', 'tuple', 'complex')
@@ -24,12 +39,26 @@ class PythonTypeSerialiser(Serialiser):
 
         return super(PythonTypeSerialiser, self).to_dict(obj)
 
+    def to_ext(self, obj):
+        if isinstance(obj, complex):
+            return EXT_COMPLEX, _complex.pack(obj.real, obj.imag)
+        return None
+
     def from_dict(self, jobj):
-        if jobj.get('__type__') == 'set':
-            return set(jobj['data'])
-        if jobj.get('__type__') == 'tuple':
-            return tuple(jobj['data'])
-        if jobj.get('__type__') == 'complex':
-            return complex(jobj['data'])
+        f = self.deserialisers().get(jobj.get('__type__'))
+        if f:
+            return f(jobj)
 
         return super(PythonTypeSerialiser, self).from_dict(jobj)
+
+    def deserialisers(self):
+        return {
+            'set': lambda jobj: set(jobj['data']),
+            'tuple': lambda jobj: tuple(jobj['data']),
+            'complex': lambda jobj: complex(jobj['data']),
+        }
+
+    def ext_deserialisers(self):
+        return {
+            EXT_COMPLEX: unpack_complex,
+        }
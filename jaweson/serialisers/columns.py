@@ -0,0 +1,179 @@
+from __future__ import absolute_import
+import copy
+import sys
+from ..serialiser import Serialiser
+from ..serialisable import Serialisable, serialised_name, _field_plan, _types
+
+# numpy is imported by the first batch, as it is slow to import
+_np = False
+
+
+def _numpy():
+    '''Returns numpy, or None if it isn't installed.
+    '''
+    global _np
+    if _np is False:
+        try:
+            import numpy
+        except ImportError:
+            # columns are stored as lists
+            numpy = None
+        _np = numpy
+    return _np
+
+
+# python type -> numpy dtype for columns which can be stored as arrays
+_column_dtypes = {
+    bool: 'bool',
+    int: 'int64',
+    float: 'float64',
+}
+
+
+def _column(values):
+    '''Returns the values as a numpy array where every value is of the
+    same numeric type, and as a list otherwise.
+    '''
+    if not values:
+        return values
+    np = _numpy()
+    if np is None:
+        return values
+    t = type(values[0])
+    dtype = _column_dtypes.get(t)
+    if dtype is None:
+        return values
+    for v in values:
+        if type(v) is not t:
+            return values
+    try:
+        return np.array(values, dtype=dtype)
+    except OverflowError:
+        return values
+
+
+def to_columns(objs):
+    '''Transposes a list of Serialisable objects of a single class
+    into a dict of field -> column.
+    Columns of bools, ints or floats are stored as numpy arrays.
+    '''
+    objs = list(objs)
+    if not objs:
+        return {
+            '__type__': 'columns',
+            '__class__': None,
+            'count': 0,
+            'columns': {},
+        }
+
+    cls = objs[0].__class__
+    if not issubclass(cls, Serialisable):
+        raise TypeError('Unable to serialise object of type {} as columns'.format(cls))
+    rows = []
+    for obj in objs:
+        if obj.__class__ is not cls:
+            raise TypeError('Columns must contain a single type, found {} and {}'.format(cls, obj.__class__))
+        rows.append(cls.to_dict(obj))
+
+    fields = sorted(rows[0])
+    keys = set(fields)
+    for row in rows:
+        if set(row) != keys:
+            raise ValueError('Columns must have the same fields for every object')
+
+    return {
+        '__type__': 'columns',
+        '__class__': serialised_name(cls),
+        'count': len(rows),
+        'columns': dict(
+            (k, _column([row[k] for row in rows]))
+            for k in fields
+        ),
+    }
+
+
+def column_dict(jobj):
+    '''Returns the deserialised dict of field -> column.
+    '''
+    return jobj['columns']
+
+
+def from_columns(jobj, types=None):
+    '''Rebuilds the list of objects from a dict of columns.
+    The class is looked up in types, a dict of serialised name -> class,
+    which defaults to every Serialisable class.
+    '''
+    if not jobj['count']:
+        return []
+
+    if types is None:
+        types = _types
+    clsname = jobj['__class__']
+    if clsname not in types:
+        raise NotImplementedError('No type registered for {}'.format(clsname))
+    cls = types[clsname]
+
+    fields = list(jobj['columns'])
+    # columns can only be arrays if numpy has been imported
+    np = sys.modules.get('numpy')
+    columns = [
+        c.tolist() if np is not None and isinstance(c, np.ndarray) else c
+        for c in jobj['columns'].values()
+    ]
+    rows = zip(*columns) if columns else [()] * jobj['count']
+
+    plan = _field_plan(cls)
+    if (
+        cls.from_dict.__func__ is not Serialisable.from_dict.__func__
+        or not plan.bulk
+        or plan.init_fields is not None
+        or not fields
+        or plan.skip.intersection(fields)
+    ):
+        # custom deserialisation, classes constructed through __init__,
+        # or values which must be set through descriptors
+        objs = []
+        for values in rows:
+            data = dict(zip(fields, values))
+            data['__type__'] = 'serialisable'
+            data['__class__'] = clsname
+            objs.append(cls.from_dict(data))
+        return objs
+
+    new = cls.__new__
+    objs = []
+    for values in rows:
+        obj = new(cls)
+        obj.__dict__.update(zip(fields, values))
+        objs.append(obj)
+    return objs
+
+
+class ColumnSerialiser(Serialiser):
+    serialised_types = ('columns',)
+
+    def __init__(self):
+        # the classes which can be deserialised, by serialised name
+        self.types = _types
+
+    def with_types(self, types):
+        '''Returns a copy of the serialiser which only deserialises the
+        classes in types. See SerialisableSerialiser.with_types.
+        '''
+        s = copy.copy(self)
+        s.types = types
+        return s
+
+    def from_dict(self, jobj):
+        if jobj.get('__type__') == 'columns':
+            return self.columns_from_dict(jobj)
+
+        return super(ColumnSerialiser, self).from_dict(jobj)
+
+    def deserialisers(self):
+        return {
+            'columns': self.columns_from_dict,
+        }
+
+    def columns_from_dict(self, jobj):
+        return from_columns(jobj, self.types)
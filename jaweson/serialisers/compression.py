@@ -0,0 +1,309 @@
+"""Compresses large fields of serialised objects.
+
+ndarrays of at least the threshold size have their data compressed, and
+the codec is stored with the array::
+
+    {
+        '__type__': 'ndarray',
+        'codec': '<codec name>',
+        'data': '<base 64 encoded compressed data>',
+        'dtype': '<numpy dtype>',
+        'shape': [<shape>,],
+    }
+
+Strings of at least the threshold length in serialised objects (ie,
+Serialisable fields) are replaced with::
+
+    {
+        '__type__': 'compressed',
+        'codec': '<codec name>',
+        'data': '<base 64 encoded compressed data>',
+        'text': <true if the value is a unicode string>,
+    }
+
+Binary formats store the compressed bytes directly, in 'buffer' for
+ndarrays and 'data' for strings.
+
+Values are only compressed when it reduces their serialised size.
+Compressed values are only decompressed by a CompressionDecoder, which
+is opt-in as untrusted documents could hold values which decompress to
+exhaust memory, and raise ValueError otherwise. Values which decompress
+to more than a maximum size are rejected.
+"""
+from __future__ import absolute_import
+import base64
+import sys
+import zlib
+from ..serialiser import Serialiser
+
+
+# fields of at least this many bytes are compressed
+COMPRESS_THRESHOLD = 1024
+
+# compressed values are rejected if they decompress to more than this many bytes
+MAX_DECOMPRESSED_SIZE = 256 * 1024 * 1024
+
+# codec name -> (compress(bytes), decompress(bytes, max_size))
+codecs = {}
+
+
+def register_codec(name, compress, decompress):
+    '''Registers a codec for use with the compress option.
+    decompress(data, max_size) must raise ValueError rather than
+    return more than max_size bytes.
+    '''
+    codecs[name] = (compress, decompress)
+
+
+def _too_large(max_size):
+    return ValueError('Compressed value decompresses to more than {} bytes'.format(max_size))
+
+
+def _check_size(data, max_size):
+    if len(data) > max_size:
+        raise _too_large(max_size)
+    return data
+
+
+def _read_limited(f, max_size):
+    '''Reads a decompressing file object, raising ValueError after max_size bytes.
+    '''
+    chunks = []
+    size = 0
+    while True:
+        chunk = f.read(64 * 1024)
+        if not chunk:
+            return b''.join(chunks)
+        size += len(chunk)
+        if size > max_size:
+            raise _too_large(max_size)
+        chunks.append(chunk)
+
+
+def _zlib_decompress(data, max_size):
+    d = zlib.decompressobj()
+    data = d.decompress(data, max_size + 1)
+    if d.unconsumed_tail:
+        raise _too_large(max_size)
+    return _check_size(data + d.flush(), max_size)
+
+
+register_codec('zlib', zlib.compress, _zlib_decompress)
+
+
+def _register_lzma():
+    try:
+        import lzma
+    except ImportError:
+        try:
+            from backports import lzma
+        except ImportError:
+            return
+
+    def decompress(data, max_size):
+        d = lzma.LZMADecompressor()
+        try:
+            data = d.decompress(data, max_size + 1)
+        except TypeError:
+            # no max_length before python 3.5, the size is checked afterwards
+            data = d.decompress(data)
+        return _check_size(data, max_size)
+    register_codec('lzma', lzma.compress, decompress)
+
+
+def _register_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return
+    register_codec(
+        'zstd',
+        lambda data: zstandard.ZstdCompressor().compress(data),
+        lambda data, max_size: _read_limited(zstandard.ZstdDecompressor().stream_reader(data), max_size),
+    )
+
+
+def _register_lz4():
+    try:
+        import lz4.frame
+    except ImportError:
+        return
+
+    def decompress(data, max_size):
+        d = lz4.frame.LZ4FrameDecompressor()
+        return _check_size(d.decompress(data, max_size + 1), max_size)
+    register_codec('lz4', lz4.frame.compress, decompress)
+
+
+# codecs with optional libraries, registered on first use
+# as the libraries are slow to import
+_optional_codecs = {
+    'lzma': _register_lzma,
+    'zstd': _register_zstd,
+    'lz4': _register_lz4,
+}
+
+
+def _codec(name):
+    try:
+        return codecs[name]
+    except KeyError:
+        pass
+    register = _optional_codecs.pop(name, None)
+    if register:
+        register()
+    try:
+        return codecs[name]
+    except KeyError:
+        raise ValueError('Unknown compression codec {}'.format(name))
+
+
+def compress(codec, data):
+    return _codec(codec)[0](data)
+
+
+def decompress(codec, data, max_size=MAX_DECOMPRESSED_SIZE):
+    '''Decompresses data, raising ValueError if it decompresses to
+    more than max_size bytes.
+    '''
+    return _codec(codec)[1](data, max_size)
+
+
+_text_type = type(u'')
+
+
+class CompressionEncoder(object):
+    '''Wraps a serialiser default function, compressing ndarrays and
+    string fields of Serialisable objects of at least threshold bytes.
+    binary is True for formats which store bytes natively (msgpack).
+    '''
+    def __init__(self, default, codec='zlib', threshold=COMPRESS_THRESHOLD, binary=False):
+        _codec(codec)
+        self._default = default
+        self.codec = codec
+        self.threshold = threshold
+        self.binary = binary
+
+    def _encode(self, data):
+        return data if self.binary else base64.b64encode(data)
+
+    def _size(self, n):
+        '''Returns the serialised size of n bytes of compressed data.
+        '''
+        return n if self.binary else 4 * ((n + 2) // 3)
+
+    def ndarray(self, obj):
+        '''Returns the compressed ndarray, or None if it doesn't compress.
+        '''
+        np = sys.modules['numpy']
+        obj = np.ascontiguousarray(obj)
+        data = compress(self.codec, obj.reshape(-1).view(np.uint8))
+        if len(data) >= obj.nbytes:
+            return None
+        return {
+            '__type__': 'ndarray',
+            'codec': self.codec,
+            'buffer' if self.binary else 'data': self._encode(data),
+            'dtype': obj.dtype.str,
+            'shape': list(obj.shape),
+        }
+
+    def string(self, value):
+        '''Returns the compressed string, or None if it doesn't compress.
+        '''
+        # text formats only have unicode strings
+        text = isinstance(value, _text_type) or not self.binary
+        raw = value.encode('utf-8') if isinstance(value, _text_type) else value
+        data = compress(self.codec, raw)
+        # uncompressed strings are stored as they are, not base 64 encoded
+        if self._size(len(data)) >= len(raw):
+            return None
+        return {
+            '__type__': 'compressed',
+            'codec': self.codec,
+            'data': self._encode(data),
+            'text': text,
+        }
+
+    def default(self, obj):
+        # objects can only be ndarrays if numpy has been imported
+        np = sys.modules.get('numpy')
+        if (
+            np is not None
+            and isinstance(obj, np.ndarray)
+            and obj.nbytes >= self.threshold
+            and not obj.dtype.hasobject
+        ):
+            data = self.ndarray(obj)
+            if data is not None:
+                return data
+
+        data = self._default(obj)
+        # only object fields are compressed, not the encoded data of
+        # other types (ie, ndarrays which didn't compress)
+        if isinstance(data, dict) and data.get('__type__') == 'serialisable':
+            for k, v in data.items():
+                if (
+                    isinstance(v, (bytes, _text_type))
+                    and len(v) >= self.threshold
+                    and k not in ('__type__', '__class__')
+                ):
+                    value = self.string(v)
+                    if value is not None:
+                        data[k] = value
+        return data
+
+
+# serialised types which can be compressed
+COMPRESSED_TYPES = ('compressed', 'ndarray', 'npgeneric')
+
+
+class CompressedStringSerialiser(Serialiser):
+    '''Rejects compressed strings loaded without a CompressionDecoder,
+    as NumpySerialiser does for compressed ndarrays.
+    '''
+    serialised_types = ('compressed',)
+
+    def from_dict(self, jobj):
+        return self.deserialisers()['compressed'](jobj)
+
+    def deserialisers(self):
+        def compressed(jobj):
+            raise ValueError('Compressed strings must be loaded with decompress')
+        return {'compressed': compressed}
+
+
+class CompressionDecoder(object):
+    '''Wraps a from_dict function, decompressing compressed strings and
+    ndarrays. Load with lazy to decompress each value on first use.
+    Values which decompress to more than max_size bytes raise ValueError.
+    '''
+    def __init__(self, from_dict, max_size=MAX_DECOMPRESSED_SIZE):
+        self._from_dict = from_dict
+        self.max_size = max_size
+
+    def from_dict(self, jobj):
+        if 'codec' in jobj and jobj.get('__type__') in COMPRESSED_TYPES:
+            return self.decompress(jobj)
+        return self._from_dict(jobj)
+
+    def decompress(self, jobj):
+        '''Returns the decompressed value.
+        '''
+        data = jobj['buffer'] if 'buffer' in jobj else jobj['data']
+        if not isinstance(data, bytes):
+            # base 64 encoded by a text format
+            data = base64.b64decode(data)
+        data = decompress(jobj['codec'], data, self.max_size)
+
+        if jobj['__type__'] == 'compressed':
+            if jobj['text']:
+                return data.decode('utf-8')
+            return data
+
+        # ndarrays are read-only views of the decompressed data
+        jobj = dict(jobj)
+        del jobj['codec']
+        jobj.pop('data', None)
+        jobj['buffer'] = data
+        return self._from_dict(jobj)
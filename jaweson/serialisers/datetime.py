@@ -1,9 +1,148 @@
 from __future__ import absolute_import
+from ..serialiser import Serialiser
+import datetime
+import re
+import struct
 
 try:
-    from ..serialiser import Serialiser
-    import datetime
     from dateutil import parser as dateparser
+    from dateutil import tz
+except ImportError:
+    # no datetime support
+    dateparser = None
+
+if dateparser is not None:
+    # the exact formats produced by isoformat
+    _date_re = re.compile(r'(\d{4})-(\d\d)-(\d\d)$')
+    _time_re = re.compile(
+        r'(\d\d):(\d\d):(\d\d)(?:\.(\d{6}))?'
+        r'(?:([+-])(\d\d):(\d\d))?$'
+    )
+    _datetime_re = re.compile(
+        r'(\d{4})-(\d\d)-(\d\d)T'
+        r'(\d\d):(\d\d):(\d\d)(?:\.(\d{6}))?'
+        r'(?:([+-])(\d\d):(\d\d))?$'
+    )
+
+    # memoised (sign, hours, minutes) -> tzinfo
+    _tzinfos = {}
+
+    def _tzinfo(sign, hours, minutes):
+        if not sign:
+            return None
+        key = (sign, hours, minutes)
+        tzinfo = _tzinfos.get(key)
+        if tzinfo is None:
+            offset = int(hours) * 3600 + int(minutes) * 60
+            tzinfo = _tzinfos[key] = _tzoffset(-offset if sign == '-' else offset)
+        return tzinfo
+
+    # memoised offset seconds -> tzinfo
+    _tzoffsets = {}
+
+    def _tzoffset(offset):
+        tzinfo = _tzoffsets.get(offset)
+        if tzinfo is None:
+            if not offset:
+                tzinfo = tz.tzutc()
+            else:
+                tzinfo = tz.tzoffset(None, offset)
+            _tzoffsets[offset] = tzinfo
+        return tzinfo
+
+    # msgpack extension type codes
+    EXT_DATETIME = 1
+    EXT_DATE = 2
+    EXT_TIME = 3
+
+    # microseconds from midnight, or from 0001-01-01 for datetimes,
+    # followed by an optional utc offset in seconds
+    _naive = struct.Struct('<q')
+    _aware = struct.Struct('<qi')
+    # date ordinal
+    _ordinal = struct.Struct('<i')
+
+    _day = 24 * 60 * 60 * 1000000
+
+    def _offset(obj):
+        '''Returns the utc offset in seconds, None if naive.
+        Raises ValueError for offsets which aren't a whole number of seconds.
+        '''
+        offset = obj.utcoffset()
+        if offset is None:
+            return None
+        if offset.microseconds:
+            raise ValueError('Sub-second utc offset')
+        return offset.days * 86400 + offset.seconds
+
+    def _pack(microseconds, offset):
+        if offset is None:
+            return _naive.pack(microseconds)
+        return _aware.pack(microseconds, offset)
+
+    def _unpack(data):
+        if len(data) == _naive.size:
+            return _naive.unpack(data)[0], None
+        microseconds, offset = _aware.unpack(data)
+        return microseconds, _tzoffset(offset)
+
+    def _time_fields(microseconds):
+        seconds, microseconds = divmod(microseconds, 1000000)
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        return hours, minutes, seconds, microseconds
+
+    def unpack_datetime(data):
+        microseconds, tzinfo = _unpack(data)
+        days, microseconds = divmod(microseconds, _day)
+        d = datetime.date.fromordinal(days)
+        return datetime.datetime(
+            d.year, d.month, d.day,
+            *_time_fields(microseconds),
+            tzinfo=tzinfo
+        )
+
+    def unpack_date(data):
+        return datetime.date.fromordinal(_ordinal.unpack(data)[0])
+
+    def unpack_time(data):
+        microseconds, tzinfo = _unpack(data)
+        return datetime.time(*_time_fields(microseconds), tzinfo=tzinfo)
+
+    def parse_datetime(s):
+        '''Parses the output of datetime.isoformat.
+        Other formats are parsed by dateutil.
+        '''
+        m = _datetime_re.match(s)
+        if not m:
+            return dateparser.parse(s)
+        y, mo, d, h, mi, sec, us, sign, tzh, tzm = m.groups()
+        return datetime.datetime(
+            int(y), int(mo), int(d),
+            int(h), int(mi), int(sec), int(us or 0),
+            _tzinfo(sign, tzh, tzm),
+        )
+
+    def parse_date(s):
+        '''Parses the output of date.isoformat.
+        Other formats are parsed by dateutil.
+        '''
+        m = _date_re.match(s)
+        if not m:
+            return dateparser.parse(s).date()
+        y, mo, d = m.groups()
+        return datetime.date(int(y), int(mo), int(d))
+
+    def parse_time(s):
+        '''Parses the output of time.isoformat.
+        Other formats are parsed by dateutil.
+        As with dateutil, the timezone is not preserved.
+        '''
+        m = _time_re.match(s)
+        if not m:
+            return dateparser.parse(s).time()
+        h, mi, sec, us = m.groups()[:4]
+        return datetime.time(int(h), int(mi), int(sec), int(us or 0))
 
     class DateTimeSerializer(Serialiser):
         python_types = (datetime.date, datetime.time, datetime.datetime)
@@ -29,15 +168,45 @@ try:
 
             return super(DateTimeSerializer, self).to_dict(obj)
 
+        def to_ext(self, obj):
+            try:
+                if isinstance(obj, datetime.datetime):
+                    microseconds = (
+                        obj.toordinal() * _day
+                        + ((obj.hour * 60 + obj.minute) * 60 + obj.second) * 1000000
+                        + obj.microsecond
+                    )
+                    return EXT_DATETIME, _pack(microseconds, _offset(obj))
+                if isinstance(obj, datetime.date):
+                    return EXT_DATE, _ordinal.pack(obj.toordinal())
+                if isinstance(obj, datetime.time):
+                    microseconds = (
+                        ((obj.hour * 60 + obj.minute) * 60 + obj.second) * 1000000
+                        + obj.microsecond
+                    )
+                    return EXT_TIME, _pack(microseconds, _offset(obj))
+            except ValueError:
+                # offsets with microseconds use the dict format
+                pass
+            return None
+
         def from_dict(self, jobj):
-            if jobj.get('__type__') == 'datetime':
-                return dateparser.parse(jobj['data'])
-            if jobj.get('__type__') == 'date':
-                return dateparser.parse(jobj['data']).date()
-            if jobj.get('__type__') == 'time':
-                return dateparser.parse(jobj['data']).time()
+            f = self.deserialisers().get(jobj.get('__type__'))
+            if f:
+                return f(jobj)
 
             return super(DateTimeSerializer, self).from_dict(jobj)
-except:
-    # no datetime support
-    pass
+
+        def deserialisers(self):
+            return {
+                'datetime': lambda jobj: parse_datetime(jobj['data']),
+                'date': lambda jobj: parse_date(jobj['data']),
+                'time': lambda jobj: parse_time(jobj['data']),
+            }
+
+        def ext_deserialisers(self):
+            return {
+                EXT_DATETIME: unpack_datetime,
+                EXT_DATE: unpack_date,
+                EXT_TIME: unpack_time,
+            }
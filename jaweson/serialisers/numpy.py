@@ -1,10 +1,14 @@
 from __future__ import absolute_import
+from ..serialiser import Serialiser
+import base64
 
 try:
-    from ..serialiser import Serialiser
-    import base64
     import numpy as np
+except ImportError:
+    # no numpy support
+    np = None
 
+if np is not None:
     class NumpySerialiser(Serialiser):
         python_types = (np.ndarray, np.generic)
         serialised_types = ('ndarray', 'npgeneric')
@@ -26,17 +30,53 @@ try:
 
             return super(NumpySerialiser, self).to_dict(obj)
 
+        def to_binary(self, obj):
+            # object arrays can't be represented by their buffer
+            if not isinstance(obj, (np.ndarray, np.bool_, np.number)) or obj.dtype.hasobject:
+                return self.to_dict(obj)
+
+            # pass the raw buffer to the packer, avoiding any intermediate copies
+            buf = memoryview(np.ascontiguousarray(obj).reshape(-1).view(np.uint8))
+            if isinstance(obj, np.ndarray):
+                return {
+                    '__type__': 'ndarray',
+                    'buffer': buf,
+                    'dtype': obj.dtype.str,
+                    # packed as an array rather than a tuple
+                    'shape': list(obj.shape),
+                }
+            return {
+                '__type__': 'npgeneric',
+                'buffer': buf,
+                'dtype': obj.dtype.str,
+            }
+
         def from_dict(self, jobj):
-            obj = np.fromstring(
-                base64.b64decode(jobj['data']),
-                dtype=np.dtype(jobj['dtype'])
-            )
-            if jobj.get('__type__') == 'ndarray':
-                return obj.reshape(jobj['shape'])
-            if jobj.get('__type__') == 'npgeneric':
-                return obj[0]
+            f = self.deserialisers().get(jobj.get('__type__'))
+            if f:
+                return f(jobj)
 
             return super(NumpySerialiser, self).from_dict(jobj)
-except:
-    # no numpy support
-    pass
+
+        def deserialisers(self):
+            return {
+                'ndarray': self.ndarray_from_dict,
+                'npgeneric': self.npgeneric_from_dict,
+            }
+
+        def _decode(self, jobj):
+            if 'codec' in jobj:
+                # see jaweson.serialisers.compression.CompressionDecoder
+                raise ValueError('Compressed {} must be loaded with decompress'.format(jobj['__type__']))
+            if 'buffer' in jobj:
+                # raw binary buffer, the array is a read-only view of it
+                return np.frombuffer(jobj['buffer'], dtype=np.dtype(jobj['dtype']))
+
+            data = base64.b64decode(jobj['data'])
+            return np.fromstring(data, dtype=np.dtype(jobj['dtype']))
+
+        def ndarray_from_dict(self, jobj):
+            return self._decode(jobj).reshape(jobj['shape'])
+
+        def npgeneric_from_dict(self, jobj):
+            return self._decode(jobj)[0]
@@ -0,0 +1,90 @@
+"""Specialises de|serialisation functions for Serialisable classes.
+
+The functions are closures over a single layout of an object's fields,
+precomputed as tuples of field names and descriptors, and call a
+fallback function for objects with a different layout. Field names from
+serialised data are only ever used as dict keys.
+"""
+from __future__ import absolute_import
+
+
+def make_encoder(clsname, attr_keys, fields, callable_fields, class_fields, slot_fields, fallback):
+    '''Returns a function which serialises an object to a dict.
+
+    attr_keys are every key of the instance __dict__, or None if
+    instances have no __dict__.
+    fields are the keys of the instance __dict__ to serialise, and
+    callable_fields the subset of fields which are excluded if callable.
+    class_fields are attributes read with getattr.
+    slot_fields are (name, descriptor) pairs, skipped if unset.
+    The checks in callable_fields and unset slots are applied by calling
+    fallback(obj), as are objects with different __dict__ keys.
+    '''
+    fields = tuple(fields)
+    class_fields = tuple(class_fields)
+    checked = tuple(k for k in fields if k in callable_fields)
+    slots = tuple(
+        (k, descriptor.__get__, k in callable_fields)
+        for k, descriptor in slot_fields
+    )
+    if attr_keys is not None:
+        size = len(attr_keys)
+        keys = frozenset(attr_keys)
+
+    def encode(obj):
+        if attr_keys is not None:
+            d = obj.__dict__
+            # keys which aren't serialised must still be present
+            if len(d) != size or not keys.issuperset(d):
+                return fallback(obj)
+            data = {k: d[k] for k in fields}
+            for k in checked:
+                if callable(data[k]):
+                    return fallback(obj)
+        else:
+            data = {}
+
+        for k in class_fields:
+            data[k] = getattr(obj, k)
+        for k, get, check in slots:
+            try:
+                v = get(obj)
+            except AttributeError:
+                return fallback(obj)
+            if check and callable(v):
+                return fallback(obj)
+            data[k] = v
+        data['__type__'] = 'serialisable'
+        data['__class__'] = clsname
+        return data
+    return encode
+
+
+def make_decoder(cls, keys, fields, slot_fields, fallback):
+    '''Returns a function which deserialises a dict to an object.
+
+    keys are every key of the serialised dict, including '__type__'
+    and '__class__'.
+    fields are the keys to set in the instance __dict__.
+    slot_fields are (name, descriptor) pairs set through the descriptor.
+    Dicts with different keys are passed to fallback(jobj).
+    '''
+    size = len(keys)
+    keys = frozenset(keys)
+    fields = tuple(fields)
+    slots = tuple(
+        (k, descriptor.__set__)
+        for k, descriptor in slot_fields
+    )
+    new = cls.__new__
+
+    def decode(jobj):
+        if len(jobj) != size or not keys.issuperset(jobj):
+            return fallback(jobj)
+        obj = new(cls)
+        if fields:
+            obj.__dict__.update([(k, jobj[k]) for k in fields])
+        for k, set_ in slots:
+            set_(obj, jobj[k])
+        return obj
+    return decode
@@ -24,11 +24,14 @@ setup(
     author='Adam Griffiths',
     url='https://github.com/someones/jaweson',
     install_requires=[],
-    tests_require=['numpy', 'python-dateutil', 'pytz', 'msgpack-python'],
+    tests_require=['numpy', 'python-dateutil', 'pytz', 'msgpack-python', 'attrs', 'simplejson'],
     extras_require={
         'numpy': ['numpy'],
         'datetime': ['python-dateutil', 'pytz'],
         'msgpack': ['msgpack-python'],
+        'simplejson': ['simplejson'],
+        'zstd': ['zstandard'],
+        'lz4': ['lz4'],
     },
     platforms=['any'],
     test_suite='tests',
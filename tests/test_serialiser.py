@@ -1,3 +1,7 @@
+import os
+import shutil
+import struct
+import tempfile
 import unittest
 import numpy as np
 from datetime import datetime, time, date
@@ -7,6 +11,21 @@ import jaweson
 from jaweson import json, msgpack
 
 
+def _unregister(predicate):
+    '''Removes the serialisers a test registered from the global registry.
+    '''
+    from jaweson import serialiser
+    removed = [s for s in serialiser._serialisers if predicate(s)]
+    serialiser._serialisers[:] = [s for s in serialiser._serialisers if not predicate(s)]
+    for s in removed:
+        for t in s.python_types:
+            serialiser._python_types.pop(t, None)
+        for t in s.serialised_types:
+            serialiser._serialised_types.pop(t, None)
+            serialiser._deserialisers.pop(t, None)
+    serialiser._cache.clear()
+
+
 class TestSerialiser(unittest.TestCase):
     def test_int(self):
         obj = 1
@@ -89,6 +108,34 @@ class TestSerialiser(unittest.TestCase):
         assert obj == jobj
         assert isinstance(jobj, complex)
 
+    def test_python_types_binary(self):
+        from collections import namedtuple, OrderedDict
+        Point = namedtuple('Point', 'x y')
+
+        obj = {
+            'tuple': (1, ('a', [2])),
+            'set': set([(1, 2), 3]),
+            'complex': complex(1.5, -2),
+            'keys': {(1, 2): 'a'},
+            'native': [Point(1, 2), np.float64(1.5), OrderedDict(a=1)],
+        }
+        data = msgpack.dumps(obj, tuples='ext', sets='ext')
+        assert b'__type__' not in data
+        encoder = msgpack.Encoder(tuples='ext', sets='ext')
+        for mobj in (msgpack.loads(data), msgpack.Decoder().loads(encoder.dumps(obj))):
+            assert mobj['tuple'] == (1, ('a', [2]))
+            assert mobj['set'] == obj['set']
+            assert mobj['complex'] == obj['complex']
+            assert mobj['keys'] == obj['keys']
+            assert mobj['native'] == [[1, 2], 1.5, {'a': 1}]
+
+        # tuples are stored as arrays by default
+        assert msgpack.loads(msgpack.dumps(obj['tuple'])) == [1, ['a', [2]]]
+        assert msgpack.loads(msgpack.dumps(obj['tuple']), use_list=False) == (1, ('a', (2,)))
+        # and sets as dicts
+        assert b'__type__' in msgpack.dumps(set([1]))
+        assert msgpack.loads(msgpack.dumps(set([1, 'a']))) == set([1, 'a'])
+
     def test_ndarray(self):
         obj = np.array([1, 2, 3], dtype=np.float32)
         mobj = msgpack.loads(msgpack.dumps(obj))
@@ -102,6 +149,353 @@ class TestSerialiser(unittest.TestCase):
         assert obj.dtype == jobj.dtype
         assert isinstance(jobj, np.ndarray)
 
+    def test_ndarray_binary(self):
+        obj = np.arange(24, dtype=np.float64).reshape(4, 6)[:, ::2]
+        data = msgpack.dumps(obj)
+        mobj = msgpack.loads(data)
+
+        assert not obj.flags['C_CONTIGUOUS']
+        assert len(data) < obj.nbytes + 64
+        assert obj.shape == mobj.shape
+        assert obj.dtype == mobj.dtype
+        assert (obj == mobj).all()
+
+    def test_ndarray_blob(self):
+        path = tempfile.mkdtemp()
+        try:
+            large = np.arange(1000, dtype=np.float32).reshape(10, 100)
+            small = np.arange(3, dtype=np.int8)
+            obj = {'large': large, 'small': small}
+            json_path = os.path.join(path, 'doc.json')
+            blob_path = os.path.join(path, 'doc.blobs')
+            with open(json_path, 'w') as f:
+                json.dump(obj, f, blob_file=blob_path, blob_threshold=1024)
+
+            with open(json_path, 'r') as f:
+                assert 'ndblob' in f.read()
+
+            # references are only resolved when requested
+            with open(json_path, 'r') as f:
+                jobj = json.load(f)
+            assert jobj['large']['__type__'] == 'ndblob'
+
+            with open(json_path, 'r') as f:
+                jobj = json.load(f, blobs=True)
+
+            assert isinstance(jobj['large'], np.memmap)
+            assert not jobj['large'].flags['WRITEABLE']
+            assert (jobj['large'] == large).all()
+            assert not isinstance(jobj['small'], np.memmap)
+            assert (jobj['small'] == small).all()
+
+            with open(json_path, 'r') as f:
+                j = f.read()
+            jobj = json.loads(j, blob_dir=path, blob_verify=True)
+            assert (jobj['large'] == large).all()
+            jobj = json.Decoder(blob_dir=path).loads(j)
+            assert (jobj['large'] == large).all()
+
+            # paths outside of the blob directory are rejected
+            for ref in (blob_path, os.path.join('..', os.path.basename(path), 'doc.blobs')):
+                with self.assertRaises(ValueError):
+                    json.loads(j.replace('doc.blobs', ref), blob_dir=path)
+
+            # each dump replaces the blob file
+            size = os.path.getsize(blob_path)
+            with open(json_path, 'w') as f:
+                json.dump(obj, f, blob_file=blob_path, blob_threshold=1024)
+            assert os.path.getsize(blob_path) == size
+        finally:
+            shutil.rmtree(path)
+
+    def test_container(self):
+        path = tempfile.mkdtemp()
+        try:
+            for format in ('json', 'msgpack'):
+                filename = os.path.join(path, 'objects.' + format)
+                with jaweson.Container(filename, 'w', format) as c:
+                    c.put('array', np.arange(5))
+                    c.put(u'date', date(2015, 1, 2))
+                    assert c.append({'a': 1}) == 0
+                    assert c.append({'a': 2}) == 1
+
+                size = os.path.getsize(filename)
+                with open(filename, 'rb') as f:
+                    original = f.read()
+                with jaweson.Container(filename, 'a') as c:
+                    assert c.format == format
+                    c.put('date', date(2016, 1, 2))
+                    c[5] = set([1])
+                    assert c.append({'a': 6}) == 6
+                # the existing frames and index are not overwritten
+                with open(filename, 'rb') as f:
+                    assert f.read(size) == original
+
+                for use_mmap in (False, True):
+                    with jaweson.Container(filename, use_mmap=use_mmap) as c:
+                        assert len(c) == 6
+                        assert list(c) == ['array', 0, 1, 'date', 5, 6]
+                        assert (c['array'] == np.arange(5)).all()
+                        assert c['date'] == date(2016, 1, 2)
+                        assert c[1] == {'a': 2}
+                        assert c.get('missing') is None
+                        self.assertRaises(KeyError, lambda: c['missing'])
+                        self.assertRaises(IOError, c.put, 'a', 1)
+
+                with jaweson.Container(filename) as c:
+                    c.copy(filename + '.copy')
+                assert os.path.getsize(filename + '.copy') < os.path.getsize(filename)
+                with jaweson.Container(filename + '.copy') as c:
+                    assert dict(c.items())[5] == set([1])
+
+                c = jaweson.Container(filename)
+                c.close()
+                self.assertRaises(ValueError, c.get, 'array')
+                self.assertRaises(ValueError, c.put, 'a', 1)
+
+            # keys which can't be stored in the index are rejected before writing
+            filename = os.path.join(path, 'keys.json')
+            with jaweson.Container(filename, 'w') as c:
+                self.assertRaises(ValueError, c.put, '\xff', 1)
+                c.put('a', 1)
+            with jaweson.Container(filename) as c:
+                assert list(c) == ['a']
+
+            with open(os.path.join(path, 'unclosed'), 'wb') as f:
+                f.write(b'JAWESONC')
+            self.assertRaises(ValueError, jaweson.Container, os.path.join(path, 'unclosed'))
+
+            # an index which can't be loaded, ie, from a torn write
+            for format in ('json', 'msgpack'):
+                filename = os.path.join(path, 'torn.' + format)
+                with jaweson.Container(filename, 'w', format) as c:
+                    c.put('a', 1)
+                with open(filename, 'r+b') as f:
+                    data = f.read()
+                    offset, length, magic = struct.unpack('<QQ8s', data[-24:])
+                    f.seek(offset)
+                    f.write(b'\x93' + b'{' * (length - 1))
+                self.assertRaisesRegexp(ValueError, 'invalid index', jaweson.Container, filename)
+        finally:
+            shutil.rmtree(path)
+
+    def test_compression(self):
+        class CompressedObject(jaweson.Serialisable):
+            def __init__(self):
+                self.text = u'compressible ' * 200
+                self.short = 'short'
+                self.array = np.zeros((100, 100), dtype=np.float32)
+                self.small = np.arange(3)
+                self.random = np.random.rand(1000)
+
+        import base64
+        from jaweson.lazy import is_lazy
+        from jaweson.serialisers import compression
+
+        class CompressedText(jaweson.Serialisable):
+            def __init__(self):
+                self.text = u'compressible ' * 200
+
+        obj = CompressedObject()
+        text = CompressedText()
+        for module in (json, msgpack):
+            data = module.dumps(obj, compress=True)
+            assert len(data) * 4 < len(module.dumps(obj))
+            mobj = module.loads(data, decompress=True)
+            assert type(mobj.text) is unicode
+            assert mobj.text == obj.text
+            assert mobj.short == obj.short
+            for k in ('array', 'small', 'random'):
+                value = getattr(mobj, k)
+                assert value.dtype == getattr(obj, k).dtype
+                assert (value == getattr(obj, k)).all()
+
+            # and dumped again
+            robj = module.loads(module.dumps(mobj))
+            assert robj.text == obj.text
+            assert (robj.array == obj.array).all()
+
+            # values are decompressed on first use with lazy
+            mobj = module.loads(data, decompress=True, lazy=True)
+            assert is_lazy(mobj.text)
+            assert (np.asarray(mobj.array) == obj.array).all()
+            assert module.loads(module.dumps(mobj)).text == obj.text
+
+            # decompression must be requested, for strings and arrays
+            self.assertRaises(ValueError, module.loads, data)
+            self.assertRaises(ValueError, module.loads, module.dumps(obj.array, compress=True))
+            self.assertRaisesRegexp(ValueError, 'strings', module.loads, module.dumps(text, compress=True))
+
+            # and is limited in size
+            self.assertRaises(ValueError, module.loads, data, decompress=1024)
+
+        # arrays which don't compress are not compressed as strings
+        assert 'compressed' not in json.dumps(obj.random, compress=True)
+
+        # strings are only compressed if their base 64 encoding is smaller
+        encoder = compression.CompressionEncoder(None)
+        assert encoder.string(u'ab' * 1000) is not None
+        assert encoder.string(unicode(base64.b64encode(os.urandom(3000)))) is None
+
+        self.assertRaises(ValueError, json.dumps, obj, compress='unknown')
+
+    def test_lazy(self):
+        from jaweson.lazy import Lazy, is_lazy, materialise
+
+        class LazyObject(jaweson.Serialisable):
+            def __init__(self):
+                self.a = 1
+
+        array = np.arange(12, dtype=np.float32).reshape(3, 4)
+        obj = {'array': array, 'date': date(2015, 1, 2), 'object': LazyObject()}
+        for module in (json, msgpack):
+            lobj = module.loads(module.dumps(obj), lazy=True)
+            value = lobj['array']
+            assert is_lazy(value)
+            assert isinstance(value, np.ndarray)
+            assert not is_lazy(value)
+            assert (value == array).all()
+            assert (value + 1 == array + 1).all()
+            assert (1 + value == array + 1).all()
+            assert (np.asarray(value) == array).all()
+            assert value.shape == array.shape
+            assert value[1, 2] == array[1, 2]
+            assert type(materialise(value)) is np.ndarray
+            assert type(lobj['date']) is date
+            assert type(lobj['object']) is LazyObject
+
+            lobj = module.loads(module.dumps(obj), lazy=['serialisable'])
+            assert type(lobj['array']) is np.ndarray
+            assert type(lobj['object']) is Lazy
+            assert lobj['object'].a == 1
+            assert isinstance(lobj['object'], LazyObject)
+
+        # lazy values are serialised as their value, including fields of objects
+        class LazyFieldObject(jaweson.Serialisable):
+            def __init__(self):
+                self.array = np.arange(3)
+                self.n = 1
+
+        obj = {'array': array, 'object': LazyFieldObject()}
+        for module in (json, msgpack):
+            for registry in (None, jaweson.Registry()):
+                dumps = module.Encoder(registry).dumps if registry else module.dumps
+                lobj = module.loads(module.dumps(obj), lazy=True)
+                assert is_lazy(lobj['object'].array)
+                robj = module.loads(dumps(lobj))
+                assert (robj['array'] == array).all()
+                assert type(robj['object'].array) is np.ndarray
+                assert (robj['object'].array == np.arange(3)).all()
+                assert robj['object'].n == 1
+            assert not callable(module.loads(module.dumps(array), lazy=True))
+
+    def test_lazy_serialisers(self):
+        import subprocess
+        import sys
+        from fractions import Fraction
+        from jaweson import serialiser
+
+        # optional dependencies are only imported when needed
+        modules = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, jaweson; from jaweson import json; json.dumps({"a": [1]}); '
+            'print(" ".join(m for m in ("numpy", "dateutil") if m in sys.modules))',
+        ], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        assert not modules.strip()
+
+        # entry points are only read for types which aren't registered
+        modules = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, datetime, jaweson; from jaweson import json; json.dumps(datetime.date(2015, 1, 2)); '
+            'print(" ".join(m for m in ("pkg_resources", "importlib.metadata") if m in sys.modules))',
+        ], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        assert not modules.strip()
+
+        path = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(path, 'lazy_fraction.py'), 'w') as f:
+                f.write(
+                    'from fractions import Fraction\n'
+                    'from jaweson import Serialiser\n'
+                    'class FractionSerialiser(Serialiser):\n'
+                    '    python_types = (Fraction,)\n'
+                    '    serialised_types = ("fraction",)\n'
+                    '    def to_dict(self, obj):\n'
+                    '        return {"__type__": "fraction", "data": str(obj)}\n'
+                    '    def from_dict(self, jobj):\n'
+                    '        return Fraction(jobj["data"])\n'
+                )
+            sys.path.insert(0, path)
+            jaweson.register_lazy(
+                'lazy_fraction',
+                python_types=('fractions.Fraction',),
+                serialised_types=('fraction',),
+            )
+            assert 'lazy_fraction' not in sys.modules
+            assert json.loads('{"__type__": "fraction", "data": "1/3"}') == Fraction(1, 3)
+            assert 'lazy_fraction' in sys.modules
+            assert json.loads(json.dumps(Fraction(2, 3))) == Fraction(2, 3)
+        finally:
+            sys.path.remove(path)
+            shutil.rmtree(path)
+            sys.modules.pop('lazy_fraction', None)
+            serialiser._lazy_python_types.pop('fractions.Fraction', None)
+            serialiser._lazy_serialised_types.pop('fraction', None)
+            serialiser._deserialisers.pop('fraction', None)
+            _unregister(lambda s: type(s).__module__ == 'lazy_fraction')
+        assert json.loads('{"__type__": "fraction", "data": "1/3"}') == {'__type__': 'fraction', 'data': '1/3'}
+
+    def test_profile(self):
+        from jaweson.profiling import Profile
+
+        class ProfiledObject(jaweson.Serialisable):
+            def __init__(self):
+                self.a = 1
+
+        obj = {'array': np.arange(10), 'objects': [ProfiledObject(), ProfiledObject()], 'set': set([1])}
+        for module in (json, msgpack):
+            events = []
+            profile = Profile(lambda *args: events.append(args))
+            module.loads(module.dumps(obj, profile=profile), profile=profile)
+            stats = profile.stats()
+            for operation in ('encode', 'decode'):
+                assert stats[operation]['ndarray']['calls'] == 1
+                assert stats[operation]['ndarray']['bytes'] > 0
+                assert stats[operation]['set']['calls'] == 1
+                name = [k for k in stats[operation] if k.endswith('ProfiledObject')]
+                assert len(name) == 1
+                assert stats[operation][name[0]]['calls'] == 2
+            assert len(events) == 8
+
+            with Profile() as profile:
+                module.loads(module.dumps(datetime(2015, 1, 2)))
+            assert sum(s['calls'] for s in profile.stats()['decode'].values()) == 1
+            profile.reset()
+            module.loads(module.dumps(obj))
+            assert profile.stats() == {'encode': {}, 'decode': {}}
+
+        # entering a profile on several threads restores each thread's previous profile
+        import threading
+        profile, outer = Profile(), Profile()
+        entered, exited = threading.Event(), threading.Event()
+
+        def worker():
+            with outer:
+                with profile:
+                    entered.set()
+                    exited.wait()
+                json.dumps(datetime(2015, 1, 2))
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        entered.wait()
+        with profile:
+            exited.set()
+            thread.join()
+        json.dumps(datetime(2015, 1, 2))
+        assert profile.stats() == {'encode': {}, 'decode': {}}
+        assert outer.stats()['encode']['datetime']['calls'] == 1
+
     def test_npgeneric(self):
         obj = np.float32(1)
         mobj = msgpack.loads(msgpack.dumps(obj))
@@ -155,6 +549,52 @@ class TestSerialiser(unittest.TestCase):
         assert obj == mobj
         assert obj == jobj
 
+    def test_datetime_binary(self):
+        from dateutil import tz
+
+        values = [
+            datetime(2013, 3, 27, 23, 5, 1, 123456),
+            datetime(2013, 3, 27, 23, 5, tzinfo=tz.tzoffset(None, -18000)),
+            datetime(1, 1, 1),
+            datetime(9999, 12, 31, 23, 59, 59, 999999, tzinfo=tz.tzutc()),
+            date(2013, 3, 27),
+            time(23, 5, 1, 123456),
+            time(23, 5, tzinfo=tz.tzoffset(None, 3600)),
+        ]
+        for obj in values:
+            data = msgpack.dumps(obj)
+            mobj = msgpack.loads(data)
+            assert len(data) < len(json.dumps(obj)) / 2
+            assert type(obj) == type(mobj)
+            assert obj == mobj
+            if not isinstance(obj, date) or isinstance(obj, datetime):
+                assert obj.utcoffset() == mobj.utcoffset()
+
+    def test_datetime_parse(self):
+        from jaweson.serialisers.datetime import parse_datetime, parse_date, parse_time
+
+        values = [
+            '2013-03-27T23:05:00',
+            '2013-03-27T23:05:00.000123',
+            '2013-03-27T23:05:00+00:00',
+            '2013-03-27T23:05:00.500000-04:56',
+            '2013-03-27T23:05:00+10:30',
+            # formats not produced by isoformat
+            '2013-03-27 23:05',
+            '27 March 2013 11:05pm',
+        ]
+        for value in values:
+            obj = parse_datetime(value)
+            expected = dateparser.parse(value)
+            assert obj == expected
+            assert obj.utcoffset() == expected.utcoffset()
+
+        for value in ['2013-03-27', '27/03/2013']:
+            assert parse_date(value) == dateparser.parse(value).date()
+
+        for value in ['23:05:00', '23:05:00.000123', '23:05:00-04:56', '11pm']:
+            assert parse_time(value) == dateparser.parse(value).time()
+
     def test_serialisable(self):
         class SerialisableObject(jaweson.Serialisable):
             def __init__(self):
@@ -252,6 +692,49 @@ class TestSerialiser(unittest.TestCase):
         assert obj.a == jobj.a
         assert obj.b == jobj.b
 
+    def test_specialised_layouts(self):
+        class LayoutObject(jaweson.Serialisable):
+            def __init__(self, a, b=None):
+                self.a = a
+                if b is not None:
+                    self.b = b
+
+        objs = [LayoutObject(1), LayoutObject(2, 3), LayoutObject(4), LayoutObject(lambda: 5)]
+        for module in [json, msgpack]:
+            mobjs = module.loads(module.dumps(objs[:3]))
+            assert [o.a for o in mobjs] == [1, 2, 4]
+            assert not hasattr(mobjs[0], 'b')
+            assert mobjs[1].b == 3
+            assert not hasattr(mobjs[2], 'b')
+
+            # callable values are not serialised
+            mobj = module.loads(module.dumps(objs[3]))
+            assert not hasattr(mobj, 'a')
+
+        # field names from serialised data are only used as keys
+        key = "a']\nraise ValueError #"
+        jobj = json.loads(json.dumps({'__type__': 'serialisable', '__class__': 'LayoutObject', key: 1}))
+        assert isinstance(jobj, LayoutObject)
+        assert getattr(jobj, key) == 1
+
+    def test_overridden_to_dict(self):
+        class OverriddenObject(jaweson.Serialisable):
+            @classmethod
+            def to_dict(cls, obj):
+                return {'c': obj.a}
+
+            @classmethod
+            def from_dict(cls, jobj):
+                return cls(jobj['c'] + 1)
+
+            def __init__(self, a):
+                self.a = a
+
+        obj = OverriddenObject(1)
+        for module in [json, msgpack]:
+            mobj = module.loads(module.dumps(obj))
+            assert mobj.a == 2
+
     def test_dodgy_constructor(self):
         class DodgyConstructor(jaweson.Serialisable):
             def __init__(self, a, b):
@@ -292,6 +775,112 @@ class TestSerialiser(unittest.TestCase):
         assert obj.child.name == jobj.child.name
         assert obj.child.child.name == jobj.child.child.name
 
+    def test_references(self):
+        class SharedNode(jaweson.Serialisable):
+            def __init__(self, name, parent=None):
+                self.name = name
+                self.parent = parent
+                self.children = []
+
+        root = SharedNode('root')
+        shared = SharedNode('shared', root)
+        root.children = [shared, shared]
+        array = np.arange(3)
+        obj = {'root': root, 'arrays': [array, array]}
+
+        for module in [json, msgpack]:
+            data = module.dumps(obj, refs=True)
+            mobj = module.loads(data, refs=True)
+
+            mroot = mobj['root']
+            assert mroot.name == 'root'
+            assert mroot.children[0] is mroot.children[1]
+            assert mroot.children[0].parent is mroot
+            assert mobj['arrays'][0] is mobj['arrays'][1]
+            assert (mobj['arrays'][0] == array).all()
+
+        # without references, cycles are an error
+        with self.assertRaises(ValueError):
+            json.dumps(obj)
+
+        # native dicts keep their keys
+        for module in [json, msgpack]:
+            data = {'__id__': 7, 'name': 'x'}
+            assert module.loads(module.dumps(data, refs=True), refs=True) == data
+            ref = module.dumps({'__type__': 'ref', 'id': 1})
+            self.assertRaisesRegexp(ValueError, 'unknown object id 1', module.loads, ref, refs=True)
+
+    def test_compact(self):
+        class CompactRecord(jaweson.Serialisable):
+            def __init__(self, i, child=None):
+                self.index = i
+                self.values = set([i])
+                self.child = child
+
+        obj = [CompactRecord(i, CompactRecord(-i)) for i in range(100)]
+
+        for module in [json, msgpack]:
+            data = module.dumps(obj, compact=True)
+            assert len(data) * 3 < len(module.dumps(obj)) * 2
+            mobj = module.loads(data, compact=True)
+
+            assert len(mobj) == 100
+            for a, b in zip(obj, mobj):
+                assert isinstance(b, CompactRecord)
+                assert a.index == b.index
+                assert a.values == b.values
+                assert a.child.index == b.child.index
+
+            mobj = module.loads(module.dumps(obj, compact=True, refs=True), compact=True, refs=True)
+            assert mobj[10].child.index == -10
+
+        # other serialised types share a schema per type and field set
+        sets = [set([i]) for i in range(10)]
+        data = json.dumps(sets, compact=True)
+        assert data.count('"set"') == 1
+        assert json.loads(data, compact=True) == sets
+
+        # the header is formatted with the document's arguments
+        data = json.dumps(obj, compact=True, indent=2, sort_keys=True)
+        assert '\n  "schemas": [' in data
+        mobj = json.loads(data, compact=True)
+        assert mobj[10].child.index == -10
+        data = json.dumps(obj, compact=True, separators=(',', ':'))
+        assert data.startswith('{"__type__":"compact","schemas":[')
+        assert json.loads(data, compact=True)[10].child.index == -10
+        for backend in ('json', 'simplejson'):
+            data = json.dumps([u'a\nb', set([1])], compact=True, indent=2, backend=backend)
+            assert json.loads(data, compact=True) == [u'a\nb', set([1])]
+
+    def test_batch(self):
+        class BatchRecord(jaweson.Serialisable):
+            def __init__(self, i):
+                self.index = i
+                self.value = i / 2.
+                self.flag = bool(i % 2)
+                self.name = str(i)
+
+        obj = [BatchRecord(i) for i in range(100)]
+
+        for module in [json, msgpack]:
+            mobj = module.loads_batch(module.dumps_batch(obj))
+            assert len(mobj) == 100
+            for a, b in zip(obj, mobj):
+                assert isinstance(b, BatchRecord)
+                assert a.index == b.index
+                assert type(a.index) == type(b.index)
+                assert a.value == b.value
+                assert a.flag == b.flag
+                assert a.name == b.name
+
+            columns = module.loads_batch(module.dumps_batch(obj), columns=True)
+            assert isinstance(columns['index'], np.ndarray)
+            assert columns['index'].dtype == np.int64
+            assert (columns['value'] == [r.value for r in obj]).all()
+            assert columns['name'] == [r.name for r in obj]
+
+            assert module.loads_batch(module.dumps_batch([])) == []
+
     def test_classname(self):
         class NewClass(json.Serialisable):
             __classname = 'OldClass'
@@ -329,6 +918,360 @@ class TestSerialiser(unittest.TestCase):
         assert a2.a is 1
         assert b2.a is 2
 
+    def test_serialiser_subclass_priority(self):
+        class PrioritySet(set):
+            pass
+
+        obj = PrioritySet([1, 2])
+        assert json.loads(json.dumps(obj)) == set([1, 2])
+
+        try:
+            class PrioritySetSerialiser(jaweson.Serialiser):
+                python_types = (PrioritySet,)
+                serialised_types = ('priorityset',)
+
+                def to_dict(self, obj):
+                    return {'__type__': 'priorityset', 'data': list(obj)}
+
+                def from_dict(self, jobj):
+                    return PrioritySet(jobj['data'])
+
+            # registering a new serialiser must invalidate the cached lookup
+            jobj = json.loads(json.dumps(obj))
+            assert isinstance(jobj, PrioritySet)
+            jobj = json.loads(json.dumps(set([1, 2])))
+            assert not isinstance(jobj, PrioritySet)
+        finally:
+            _unregister(lambda s: type(s).__name__ == 'PrioritySetSerialiser')
+        assert json.loads(json.dumps(obj)) == set([1, 2])
+        assert 'priorityset' not in json.dumps(obj)
+
+    def test_json_iterencode(self):
+        def records(n):
+            for i in range(n):
+                yield {'i': i, 's': set([i])}
+
+        chunks = list(json.iterencode(records(1000), chunk_size=1024))
+        assert len(chunks) > 1
+        jobj = json.loads(''.join(chunks))
+        assert len(jobj) == 1000
+        assert jobj[10] == {'i': 10, 's': set([10])}
+
+        assert json.loads(''.join(json.iterencode({'a': iter([])}))) == {'a': []}
+        assert json.loads(''.join(json.iterencode(np.float32(1)))) == np.float32(1)
+
+    def test_json_iterload(self):
+        from io import StringIO
+
+        obj = [{'i': i, 's': set([i])} for i in range(100)] + [12345, 'a']
+        data = json.dumps(obj)
+        items = json.iterload(StringIO(unicode(data)), chunk_size=16)
+        assert list(items) == obj
+
+        data = '\n'.join(json.dumps(item) for item in obj) + '\n'
+        items = json.iterload(StringIO(unicode(data)), chunk_size=16)
+        assert list(items) == obj
+
+        data = '[1, 2]\n[3]\n'
+        items = json.iterload(StringIO(unicode(data)), array=False)
+        assert list(items) == [[1, 2], [3]]
+
+        assert list(json.iterload(StringIO(u' [ ] '))) == []
+
+        with self.assertRaises(ValueError):
+            list(json.iterload(StringIO(u'[1, 2')))
+
+    def test_json_feed_decoder(self):
+        obj = [
+            {'s': 'a "quoted" ]} [{ string \\', 'n': [1.5, -2, None, True]},
+            'string \\"',
+            123,
+            set([1, 2]),
+        ]
+        for data in (json.dumps(obj), '\n'.join(json.dumps(v) for v in obj)):
+            decoder = json.FeedDecoder()
+            values = []
+            for c in data:
+                values += decoder.feed(c)
+            values += decoder.close()
+            assert values == obj
+
+        decoder = json.FeedDecoder()
+        assert decoder.feed('[{"a": [1, 2]}, {"b"') == [{'a': [1, 2]}]
+        assert decoder.feed(': 3}') == [{'b': 3}]
+        assert decoder.feed(']') == []
+        assert decoder.close() == []
+
+        decoder = json.FeedDecoder()
+        decoder.feed('{"a": 1')
+        self.assertRaises(ValueError, decoder.close)
+
+    def test_msgpack_iterload(self):
+        from io import BytesIO
+
+        obj = [{'i': i, 's': set([i])} for i in range(100)]
+        data = b''.join(msgpack.dumps(item) for item in obj)
+        items = msgpack.iterload(BytesIO(data), read_size=16)
+        assert list(items) == obj
+
+        items = msgpack.iterload(BytesIO(msgpack.dumps(obj)), array=True)
+        assert list(items) == obj
+
+        for array, data in ((False, data), (True, msgpack.dumps(obj))):
+            decoder = msgpack.FeedDecoder(array)
+            values = []
+            for i in range(len(data)):
+                values += decoder.feed(data[i:i + 1])
+            values += decoder.close()
+            assert values == obj
+
+        decoder = msgpack.FeedDecoder()
+        decoder.feed(data[:-1])
+        self.assertRaises(ValueError, decoder.close)
+
+    def test_unknown_type_tag(self):
+        obj = {'__type__': 'not_a_registered_type', 'a': 1}
+        assert json.loads(json.dumps(obj)) == obj
+        assert msgpack.loads(msgpack.dumps(obj)) == obj
+
+        obj = {'__type__': [1, 2], 'a': 1}
+        assert json.loads(json.dumps(obj)) == obj
+
+    def test_serialisable_fields(self):
+        class FieldsObject(jaweson.Serialisable):
+            b = 2
+
+            def __init__(self):
+                self.a = 1
+                self.f = lambda: 1
+
+            @property
+            def c(self):
+                return 3
+
+            def d(self):
+                return 4
+
+        obj = FieldsObject()
+        data = FieldsObject.to_dict(obj)
+        assert data == {'a': 1, 'b': 2}
+
+        # the field plan must be refreshed when the class changes
+        FieldsObject.e = 5
+        data = FieldsObject.to_dict(obj)
+        assert data == {'a': 1, 'b': 2, 'e': 5}
+
+        del FieldsObject.b
+        data = FieldsObject.to_dict(obj)
+        assert data == {'a': 1, 'e': 5}
+
+    def test_serialisable_slots(self):
+        class SlotsObject(jaweson.Serialisable):
+            __slots__ = ('a', 'b', 'c')
+
+            def __init__(self, a, b):
+                self.a = a
+                self.b = b
+
+        obj = SlotsObject(1, [2, 3])
+        assert not hasattr(obj, '__dict__')
+        assert SlotsObject.to_dict(obj) == {'a': 1, 'b': [2, 3]}
+
+        mobj = msgpack.loads(msgpack.dumps(obj))
+        jobj = json.loads(json.dumps(obj))
+
+        assert isinstance(jobj, SlotsObject)
+        assert obj.a == mobj.a
+        assert obj.b == mobj.b
+        assert obj.a == jobj.a
+        assert obj.b == jobj.b
+        assert not hasattr(jobj, 'c')
+
+    def test_serialisable_setattr(self):
+        class SetAttrObject(jaweson.Serialisable):
+            def __init__(self):
+                self.a = 1
+
+            def __setattr__(self, key, value):
+                super(SetAttrObject, self).__setattr__(key, value * 2)
+
+        obj = SetAttrObject()
+        jobj = json.loads(json.dumps(obj))
+
+        assert obj.a == 2
+        assert jobj.a == 4
+
+    def test_serialisable_attrs(self):
+        try:
+            import attr
+        except ImportError:
+            return
+
+        @attr.s
+        class AttrsObject(jaweson.Serialisable):
+            a = attr.ib(validator=attr.validators.instance_of(int))
+            _b = attr.ib(default=2)
+            c = attr.ib(init=False, default=3)
+
+        @attr.s(frozen=True)
+        class FrozenAttrsObject(jaweson.Serialisable):
+            a = attr.ib(validator=attr.validators.instance_of(int))
+
+        @attr.s(slots=True)
+        class SlotsAttrsObject(jaweson.Serialisable):
+            a = attr.ib()
+
+        obj = AttrsObject(1, 4)
+        obj.c = 5
+        for serialiser in (json, msgpack):
+            sobj = serialiser.loads(serialiser.dumps(obj))
+            assert sobj == obj
+            assert sobj.c == 5
+
+            sobj = serialiser.loads(serialiser.dumps(FrozenAttrsObject(1)))
+            assert sobj == FrozenAttrsObject(1)
+
+            sobj = serialiser.loads(serialiser.dumps(SlotsAttrsObject([1, 2])))
+            assert isinstance(sobj, SlotsAttrsObject)
+            assert sobj.a == [1, 2]
+            assert not hasattr(sobj, '__dict__')
+
+        # deserialising runs the attrs validators
+        j = json.dumps(FrozenAttrsObject(1)).replace('1', '"1"')
+        with self.assertRaises(TypeError):
+            json.loads(j)
+
+        # including for batches
+        objs = json.loads_batch(json.dumps_batch([AttrsObject(1), AttrsObject(2)]))
+        assert objs == [AttrsObject(1), AttrsObject(2)]
+        j = json.dumps({
+            '__type__': 'columns',
+            '__class__': 'AttrsObject',
+            'count': 1,
+            'columns': {'a': ['1']},
+        })
+        with self.assertRaises(TypeError):
+            json.loads_batch(j)
+
+    def test_json_backends(self):
+        from jaweson import backends
+        import json as stdlib
+
+        class BackendObject(jaweson.Serialisable):
+            def __init__(self):
+                self.a = {'b': [1, 2.5, None]}
+                self.d = datetime(2015, 1, 2, 3, 4, 5)
+
+        obj = [BackendObject(), set([1, 2]), {1: 'int key'}, np.arange(3)]
+        expected = stdlib.loads(json.dumps(obj))
+        # every backend's library is in tests_require
+        for name in backends.backends:
+            j = json.dumps(obj, backend=name)
+            assert stdlib.loads(j) == expected
+            for jobj in (json.loads(j, backend=name), json.Decoder(backend=name).loads(j)):
+                assert jobj[0].a == obj[0].a
+                assert jobj[0].d == obj[0].d
+                assert jobj[1] == obj[1]
+                assert (jobj[3] == obj[3]).all()
+            assert json.Encoder(backend=name).dumps(obj) == j
+        assert backends.get_backend('auto').name == 'simplejson'
+
+        self.assertRaises(ValueError, backends.get_backend, 'unknown')
+
+    def test_encoder_decoder(self):
+        import threading
+
+        class EncoderObject(jaweson.Serialisable):
+            def __init__(self, a):
+                self.a = a
+                self.b = set([a])
+
+        class OtherEncoderObject(jaweson.Serialisable):
+            pass
+
+        for module in (json, msgpack):
+            encoder = module.Encoder()
+            decoder = module.Decoder()
+            obj = [EncoderObject(1), datetime(2015, 1, 2), np.arange(3)]
+            data = encoder.dumps(obj)
+            assert data == module.dumps(obj)
+            dobj = decoder.loads(data)
+            assert dobj[0].a == 1
+            assert dobj[0].b == set([1])
+            assert dobj[1] == obj[1]
+            assert (dobj[2] == obj[2]).all()
+
+            # registries only deserialise their own types
+            decoder = module.Decoder(jaweson.Registry(types=[EncoderObject]))
+            assert decoder.loads(data)[0].a == 1
+            self.assertRaises(NotImplementedError, decoder.loads, encoder.dumps(OtherEncoderObject()))
+            self.assertRaises(NotImplementedError, decoder.loads, module.dumps_batch([OtherEncoderObject()]))
+            assert decoder.loads(module.dumps_batch([EncoderObject(2)]))[0].a == 2
+
+            # encoders can be shared between threads
+            results = {}
+            def encode(n):
+                results[n] = [encoder.dumps(EncoderObject(n)) for _ in range(100)]
+            threads = [threading.Thread(target=encode, args=(n,)) for n in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            for n, values in results.items():
+                assert all(module.loads(v).a == n for v in values)
+
+    def test_parallel(self):
+        from jaweson import parallel
+
+        class ParallelObject(jaweson.Serialisable):
+            def __init__(self, a):
+                self.a = a
+
+        values = [
+            [ParallelObject(i) for i in range(50)],
+            dict(('k{}'.format(i), set([i])) for i in range(50)),
+            # converted to strings by the JSON encoder
+            dict((i, i) for i in range(50)),
+        ]
+        for module in (json, msgpack):
+            for obj in values:
+                data = module.dumps(obj)
+                assert module.dumps(obj, workers=3, pool='thread') == data
+
+        # plain values can be sent to worker processes
+        obj = [{'a': np.arange(i), 'b': datetime(2015, 1, i + 1)} for i in range(20)]
+        assert json.dumps(obj, workers=2, sort_keys=True) == json.dumps(obj, sort_keys=True)
+        assert msgpack.dumps(obj, workers=2) == msgpack.dumps(obj)
+
+        for format in ('json', 'msgpack'):
+            data = parallel.dumps_frames(obj, format, workers=2)
+            frames = parallel.loads_frames(data, format, workers=2)
+            assert len(frames) == len(obj)
+            assert all((a['a'] == b['a']).all() and a['b'] == b['b'] for a, b in zip(obj, frames))
+        from io import StringIO
+        assert len(list(json.iterload(StringIO(unicode(parallel.dumps_frames(obj, workers=2)))))) == len(obj)
+
+        # only newlines delimit JSON frames
+        obj = [u'a\u2028b', u'c\x85d']
+        data = parallel.dumps_frames(obj, workers=2, pool='thread', ensure_ascii=False)
+        assert parallel.loads_frames(data, workers=2, pool='thread') == obj
+
+        # pools are shared between calls until they are closed
+        pool = parallel._shared_pool('thread', 3)
+        assert json.dumps(obj, workers=3, pool='thread') == json.dumps(obj)
+        assert parallel._shared_pool('thread', 3) is pool
+        parallel.close_pools()
+        assert parallel._shared_pool('thread', 3) is not pool
+        parallel.close_pools()
+
+        # the GIL is released for large buffers and compression
+        arrays = [np.zeros(parallel.GIL_FREE_BYTES) for _ in range(4)]
+        assert parallel._auto_pool('msgpack', arrays, {}) == 'thread'
+        assert parallel._auto_pool('json', arrays, {}) == 'process'
+        assert parallel._auto_pool('json', arrays, {'compress': True}) == 'thread'
+        assert parallel._auto_pool('msgpack', arrays + [1], {}) == 'process'
+        assert msgpack.dumps(arrays, workers=2) == msgpack.dumps(arrays)
+
 
 if __name__ == '__main__':
     unittest.main()